@@ -0,0 +1,326 @@
+"""
+bench.py
+========
+قياس أداء كل مراحل المعالجة المحلية (بدون fal وبدون إنترنت):
+detect_face، face_aware_crop، enhance_photo، build_sheet، ترميز JPEG،
+generate_qr، لصق الصورة في البطاقة (paste_photo)، بطاقة CNSS، البطاقة العائلية.
+
+لكل حالة: الزمن (الوسيط والأدنى)، الإنتاجية (عملية/ث و ميغابكسل/ث)،
+وذروة الذاكرة RSS أثناء المرحلة. المقارنة مع خط أساس محفوظ تُعلّم التراجعات.
+
+    python bench.py                      # تشغيل + مقارنة مع bench_baseline.json
+    python bench.py --save-baseline      # حفظ النتائج كخط أساس جديد
+    python bench.py -k sheet --repeat 10 # تصفية الحالات
+    python bench.py --fixtures photos/   # مجلد صور آخر (افتراضياً bench_fixtures/)
+    python bench.py --require-baseline   # في CI: غياب خط الأساس فشل وليس نجاحاً
+
+يرجع برمز 1 عند وجود تراجع أكبر من --threshold، و 2 مع --require-baseline بدون خط أساس.
+
+خط الأساس المرجعي bench_baseline.json محفوظ في المستودع مع وصف الجهاز (meta).
+الأزمنة لا تُقارن إلا على نفس الجهاز: عند اختلافه يُطبع تحذير — أعد إنشاءه على
+جهاز CI نفسه (--save-baseline) واحفظه كملف ناتج (artifact) أو في المستودع.
+bench_fixtures/ صور شخصية إضافية تُقاس مع الصور الاصطناعية.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import statistics
+import tempfile
+from pathlib import Path
+
+os.environ.pop("FAL_KEY", None)   # لا استدعاءات بعيدة أثناء القياس
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+import main
+import card_engine
+from cnss_card_api import generate_cnss_card
+
+
+ROOT          = Path(__file__).parent
+BASELINE_PATH = ROOT / "bench_baseline.json"
+DPIS          = (150, 300, 600)
+SOURCE_SIZES  = ((640, 853), (1200, 1600), (2400, 3200))
+
+
+# ── صور اصطناعية ثابتة (نفس البكسلات في كل تشغيل) ─────────────
+def synthetic_portrait(w: int, h: int, seed: int = 7) -> Image.Image:
+    """صورة شخصية اصطناعية: خلفية متدرجة + رأس + عينان + كتفان + ضجيج خفيف"""
+    rng = np.random.default_rng(seed)
+    yy  = np.linspace(0, 1, h, dtype=np.float32)[:, None]
+    bg  = np.empty((h, w, 3), np.float32)
+    bg[..., 0] = 90 + 60 * yy
+    bg[..., 1] = 110 + 40 * yy
+    bg[..., 2] = 140 + 30 * yy
+    bg += rng.normal(0, 4, bg.shape)
+    img = Image.fromarray(np.clip(bg, 0, 255).astype(np.uint8))
+
+    d  = ImageDraw.Draw(img)
+    cx = w // 2
+    fw, fh = int(w * 0.34), int(h * 0.34)
+    top = int(h * 0.16)
+    d.ellipse([cx - w * 0.42, h * 0.70, cx + w * 0.42, h * 1.3], fill=(40, 45, 60))
+    d.rectangle([cx - fw * 0.22, top + fh * 0.9, cx + fw * 0.22, h * 0.75], fill=(205, 160, 130))
+    d.ellipse([cx - fw // 2, top, cx + fw // 2, top + fh], fill=(214, 170, 140))
+    d.ellipse([cx - fw * 0.52, top - fh * 0.06, cx + fw * 0.52, top + fh * 0.32], fill=(35, 25, 20))
+    for ex in (cx - fw * 0.2, cx + fw * 0.2):
+        ey = top + fh * 0.45
+        d.ellipse([ex - fw * 0.08, ey - fh * 0.03, ex + fw * 0.08, ey + fh * 0.03], fill=(250, 250, 250))
+        d.ellipse([ex - fw * 0.035, ey - fh * 0.03, ex + fw * 0.035, ey + fh * 0.03], fill=(40, 30, 25))
+    d.ellipse([cx - fw * 0.18, top + fh * 0.74, cx + fw * 0.18, top + fh * 0.8], fill=(150, 80, 80))
+    return img.filter(ImageFilter.GaussianBlur(max(1, w // 600)))
+
+
+def load_fixtures(folder) -> dict:
+    if not folder or not Path(folder).is_dir():
+        return {}
+    out = {}
+    for p in sorted(Path(folder).iterdir()):
+        if p.suffix.lower() in (".jpg", ".jpeg", ".png"):
+            out[f"fixture:{p.stem}"] = Image.open(p).convert("RGB")
+    return out
+
+
+def photo_size(dpi):
+    size = main.PHOTO_SIZES["cin"]
+    return main.mm_to_px(size["width_mm"], dpi), main.mm_to_px(size["height_mm"], dpi)
+
+
+def family_plan(tmpdir: Path) -> card_engine.RenderPlan:
+    """خطة البطاقة العائلية — قالب SVG غير مضمّن في المستودع: خلفية نقطية اصطناعية بنفس المقاس"""
+    layout = card_engine.load_layout("family")
+    layout["background"] = {"kind": "image"}
+    path = tmpdir / "family_bg.png"
+    synthetic_portrait(*layout["size"], seed=5).save(path)
+    return card_engine.compile_layout(layout, str(path))
+
+
+def cnss_background(tmpdir: Path) -> str:
+    for name in ("AMO_IAM_PNG.png", "AMO IAM PNG.png"):
+        if (ROOT / name).exists():
+            return str(ROOT / name)
+    path = tmpdir / "cnss_bg.png"
+    synthetic_portrait(2000, 1294, seed=3).save(path)
+    return str(path)
+
+
+# ── الحالات ───────────────────────────────────────────────────
+def build_cases(sources: dict, tmpdir: Path) -> list:
+    """كل حالة: (الاسم، دالة تحضير تُرجع (دالة القياس، عدد البكسلات))"""
+    cases = []
+
+    for src_name, src in sources.items():
+        def setup_detect(src=src):
+            arr = np.array(src)
+            return (lambda: main.detect_face(arr)), src.width * src.height
+        cases.append((f"detect_face[{src_name}]", setup_detect))
+
+        for dpi in DPIS:
+            def setup_crop(src=src, dpi=dpi):
+                tw, th = photo_size(dpi)
+                return (lambda: main.face_aware_crop(src, tw, th)), tw * th
+            cases.append((f"face_aware_crop[{src_name},{dpi}dpi]", setup_crop))
+
+    base = sources["synthetic:1200x1600"]   # مصدر المراحل اللاحقة للقص
+
+    for dpi in DPIS:
+        tw, th = photo_size(dpi)
+        photo  = base.resize((tw, th), Image.LANCZOS)
+
+        cases.append((f"enhance_photo[{dpi}dpi]",
+                      lambda photo=photo: ((lambda: main.enhance_photo(photo)), photo.width * photo.height)))
+        cases.append((f"encode_photo_jpeg[{dpi}dpi]",
+                      lambda photo=photo: ((lambda: main.encode_image(photo, "jpeg")), photo.width * photo.height)))
+
+        for layout, lyt in main.LAYOUTS.items():
+            pad = main.mm_to_px(3, dpi)
+
+            def setup_sheet(photo=photo, lyt=lyt, pad=pad):
+                fn = lambda: main.build_sheet(photo, lyt["cols"], lyt["rows"], pad)
+                return fn, photo.width * photo.height * lyt["cols"] * lyt["rows"]
+            cases.append((f"build_sheet[{layout},{dpi}dpi]", setup_sheet))
+
+            def setup_encode(photo=photo, lyt=lyt, pad=pad, dpi=dpi):
+                sheet = main.build_sheet(photo, lyt["cols"], lyt["rows"], pad)
+                return (lambda: main.encode_image(sheet, "jpeg", dpi=dpi)), sheet.width * sheet.height
+            cases.append((f"encode_sheet_jpeg[{layout},{dpi}dpi]", setup_encode))
+
+    cases.append(("generate_qr", lambda: (
+        (lambda: card_engine.generate_qr("https://drive.google.com/file/d/0123456789abcdef/view", 226)),
+        226 * 226)))
+
+    def setup_paste():
+        plan  = family_plan(tmpdir)
+        card  = plan.static_layer.copy()
+        _, _, pw, ph, _ = plan.photo_slot
+        photo = base.resize((pw, ph))   # crop_face يُرجع الصورة بمقاس المكان مسبقاً
+        return (lambda: plan.paste_photo(card, photo)), pw * ph
+    cases.append(("card_paste_photo", setup_paste))
+
+    bg_path = cnss_background(tmpdir)
+    record  = dict(reg_num="906280021", nom_ar="العلوي", prenom_ar="محمد", birth_date="01-01-1970",
+                   cin="AB123456", reg_date="08-02-2026", nom_fr="ALAOUI", prenom_fr="MOHAMED")
+
+    def cnss_pixels():
+        w, h = card_engine.get_plan("cnss", bg_path).static_layer.size
+        return w * h
+
+    def setup_cnss_compile():
+        layout = card_engine.load_layout("cnss")
+        return (lambda: card_engine.compile_layout(layout, bg_path)), cnss_pixels()
+    cases.append(("cnss_compile", setup_cnss_compile))
+
+    def setup_cnss():
+        pixels = cnss_pixels()   # ترجمة الخطة خارج القياس
+        return (lambda: generate_cnss_card(**record, bg_path=bg_path)), pixels
+    cases.append(("generate_cnss_card", setup_cnss))
+
+    def setup_family():
+        plan   = family_plan(tmpdir)
+        photo  = base.resize((511, 511))
+        values = {name: "ابراهيم العلوي" if op.shape else "AB123456" for name, op in plan.fields.items()}
+        fn = lambda: plan.encode(plan.render(values, photo=photo, qr="https://drive.google.com/x"))
+        return fn, plan.static_layer.width * plan.static_layer.height
+    cases.append(("family_card_render_encode", setup_family))
+
+    return cases
+
+
+# ── القياس ────────────────────────────────────────────────────
+def _rss_mb(field: str) -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # احتياط (macOS/غيره): ذروة العملية كاملة
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _reset_peak_rss():
+    """يعيد ذروة RSS إلى القيمة الحالية (Linux ≥ 4.0)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def run_case(setup, repeat: int) -> dict:
+    fn, pixels = setup()
+    fn()   # إحماء
+    gc.collect()
+    rss_before = _rss_mb("VmRSS")
+    _reset_peak_rss()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    median = statistics.median(times)
+    return {
+        "median_s":      median,
+        "min_s":         min(times),
+        "ops_per_s":     1 / median if median else float("inf"),
+        "mpix_per_s":    pixels / 1e6 / median if median else float("inf"),
+        "peak_rss_mb":   _rss_mb("VmHWM"),
+        "rss_growth_mb": max(0.0, _rss_mb("VmHWM") - rss_before),
+    }
+
+
+def machine_meta(repeat: int) -> dict:
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            cpu = next((l.split(":", 1)[1].strip() for l in f if l.startswith("model name")), cpu)
+    except OSError:
+        pass
+    return {"python": platform.python_version(), "machine": platform.machine(), "cpu": cpu,
+            "cpus": os.cpu_count(), "repeat": repeat}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base or "min_s" not in base:
+            r["vs_baseline"] = None
+            continue
+        # الأدنى وليس الوسيط: أقل تأثراً بضجيج الجهاز (عمليات أخرى، تردد المعالج)
+        ratio = r["min_s"] / base["min_s"]
+        r["vs_baseline"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def run(argv=None):
+    ap = argparse.ArgumentParser(description="قياس أداء مراحل المعالجة المحلية")
+    ap.add_argument("-k", "--filter", default="", help="تشغيل الحالات التي يحتوي اسمها على النص فقط")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--fixtures", default=str(ROOT / "bench_fixtures"), help="مجلد صور حقيقية")
+    ap.add_argument("--baseline", default=str(BASELINE_PATH))
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--threshold", type=float, default=0.20, help="نسبة التراجع المسموح بها")
+    ap.add_argument("--json", help="حفظ النتائج الكاملة في ملف JSON")
+    ap.add_argument("--require-baseline", action="store_true",
+                    help="الفشل (رمز 2) عند غياب خط الأساس بدل التخطي")
+    args = ap.parse_args(argv)
+
+    sources = {f"synthetic:{w}x{h}": synthetic_portrait(w, h) for w, h in SOURCE_SIZES}
+    sources.update(load_fixtures(args.fixtures))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, setup in build_cases(sources, Path(tmp)):
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = run_case(setup, args.repeat)
+            r = results[name]
+            print(f"{name:<44} {r['median_s'] * 1000:9.2f} ms  {r['ops_per_s']:8.2f} op/s  "
+                  f"{r['mpix_per_s']:8.1f} Mpx/s  peak {r['peak_rss_mb']:7.1f} MB  "
+                  f"(+{r['rss_growth_mb']:.1f})", flush=True)
+
+    baseline_path = Path(args.baseline)
+    stored   = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    baseline = stored.get("results", {})
+    regressions = compare(results, baseline, args.threshold)
+
+    meta = machine_meta(args.repeat)
+    base_meta = stored.get("meta", {})
+    if baseline and any(base_meta.get(k) != meta[k] for k in ("machine", "cpu", "cpus")):
+        print(f"\nتحذير: خط الأساس من جهاز آخر ({base_meta.get('cpu')}, {base_meta.get('cpus')} cpus) — "
+              "المقارنة تقريبية")
+    if args.json:
+        Path(args.json).write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+    if args.save_baseline:
+        merged = {**baseline, **{k: {"min_s": v["min_s"], "median_s": v["median_s"]}
+                                 for k, v in results.items()}}
+        baseline_path.write_text(json.dumps({"meta": meta, "results": merged}, indent=2, sort_keys=True) + "\n")
+        print(f"\nخط الأساس محفوظ: {baseline_path}")
+        return 0
+
+    if not baseline:
+        print("\nلا يوجد خط أساس — شغّل مع --save-baseline لإنشائه")
+        return 2 if args.require_baseline else 0
+    if regressions:
+        print(f"\nتراجع في الأداء (> {args.threshold:.0%}):")
+        for name, ratio in regressions:
+            print(f"  REGRESSION  {name:<44} ×{ratio:.2f}")
+        return 1
+    print(f"\nلا تراجع مقارنة بخط الأساس (العتبة {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
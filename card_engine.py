@@ -0,0 +1,278 @@
+"""
+card_engine.py
+==============
+محرك قوالب البطاقات — وصف تصريحي (JSON) يُترجم مرة واحدة إلى خطة رسم:
+  • الخطوط محمّلة مسبقاً
+  • الإحداثيات والأحجام محسوبة بالمقياس النهائي
+  • طبقة ثابتة (الخلفية + النصوص الثابتة) مرسومة مسبقاً
+ثم تُنفذ الخطة لكل سجل بأقل عمل ممكن: نسخ الطبقة الثابتة + الحقول المتغيرة.
+
+ملفات القوالب في مجلد card_layouts/<name>.json — إضافة نوع بطاقة جديد
+لا تحتاج إلى كود رسم جديد.
+"""
+
+import io
+import os
+import json
+import hashlib
+import functools
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+import metrics
+
+
+LAYOUTS_DIR = Path(os.getenv("CARD_LAYOUTS_DIR", Path(__file__).parent / "card_layouts"))
+_FONT_DIR   = Path(os.getenv("FONT_DIR", "/usr/share/fonts/truetype"))
+
+_ALIGNS = ("left", "right", "center")
+
+
+# ── أدوات مساعدة ──────────────────────────────────────────────
+def _find_font(names: list) -> str:
+    """يبحث عن أول خط متاح من القائمة (مسار كامل أو اسم ملف داخل FONT_DIR)"""
+    for name in names:
+        if os.path.isabs(name):
+            if os.path.exists(name):
+                return name
+            continue
+        for f in _FONT_DIR.rglob(name):
+            return str(f)
+    return None
+
+
+def _font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    try:
+        return ImageFont.truetype(path, size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+def shape_arabic(text: str) -> str:
+    """تشكيل النص العربي للعرض الصحيح"""
+    try:
+        import arabic_reshaper
+        from bidi.algorithm import get_display
+        return get_display(arabic_reshaper.reshape(text))
+    except Exception:
+        return text
+
+
+def rasterize_svg(svg_path: str, width: int, height: int) -> Image.Image:
+    """
+    تحويل SVG إلى PNG عبر cairosvg (على السيرفر)
+    أو استخدام Inkscape كبديل
+    """
+    try:
+        import cairosvg
+        png_bytes = cairosvg.svg2png(url=svg_path, output_width=width, output_height=height)
+        return Image.open(io.BytesIO(png_bytes)).convert("RGBA")
+    except ImportError:
+        pass
+
+    # بديل: Inkscape
+    import subprocess, tempfile
+    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        subprocess.run([
+            "inkscape", svg_path,
+            f"--export-width={width}",
+            f"--export-height={height}",
+            f"--export-filename={tmp_path}"
+        ], check=True, capture_output=True)
+        img = Image.open(tmp_path).convert("RGBA")
+        os.unlink(tmp_path)
+        return img
+    except Exception:
+        pass
+
+    raise RuntimeError("تعذّر تحويل SVG — تأكد من تثبيت cairosvg أو inkscape")
+
+
+def generate_qr(url: str, size: int) -> Image.Image:
+    import qrcode
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=1,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
+    return img.resize((size, size), Image.LANCZOS)
+
+
+def rounded_mask(size: tuple, radius: int) -> Image.Image:
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle(
+        [0, 0, size[0]-1, size[1]-1], radius=radius, fill=255)
+    return mask
+
+
+# ── عناصر الخطة المترجمة ─────────────────────────────────────
+class TextOp:
+    """حقل نص جاهز للرسم: خط محمّل + إحداثيات بالمقياس النهائي"""
+    __slots__ = ("x", "y", "align", "font", "fill", "shape")
+
+    def __init__(self, x, y, align, font, fill, shape):
+        self.x, self.y, self.align = x, y, align
+        self.font, self.fill, self.shape = font, fill, shape
+
+    def draw(self, draw: ImageDraw.ImageDraw, text: str):
+        if not text or not text.strip():
+            return
+        if self.shape:
+            text = shape_arabic(text)
+        x = self.x
+        if self.align != "left":
+            bbox = self.font.getbbox(text)
+            w    = bbox[2] - bbox[0]
+            x    = x - w if self.align == "right" else x - w // 2
+        draw.text((x, self.y), text, font=self.font, fill=self.fill)
+
+
+class RenderPlan:
+    """خطة رسم مترجمة لقالب واحد — تُبنى مرة وتُستعمل لكل سجل"""
+
+    def __init__(self, name, version, static_layer, fields, photo_slot, qr_slot, output):
+        self.name         = name
+        self.version      = version
+        self.static_layer = static_layer   # صورة RGB: الخلفية + النصوص الثابتة
+        self.fields       = fields         # {اسم الحقل: TextOp}
+        self.photo_slot   = photo_slot     # (x, y, w, h, mask) أو None
+        self.qr_slot      = qr_slot        # (x, y, size) أو None
+        self.output       = output
+
+    @metrics.timed("card_render")
+    def render(self, values: dict, photo: Image.Image = None, qr=None) -> Image.Image:
+        """
+        تنفيذ الخطة لسجل واحد.
+        qr: نص الرابط أو صورة جاهزة من render_qr (لتوليدها بالتوازي)
+        """
+        card = self.static_layer.copy()
+        if photo is not None:
+            self.paste_photo(card, photo)
+        if isinstance(qr, str):
+            qr = self.render_qr(qr)
+        if qr is not None:
+            card.paste(qr, self.qr_slot[:2])
+        draw = ImageDraw.Draw(card)
+        for field_name, op in self.fields.items():
+            op.draw(draw, values.get(field_name, ""))
+        return card
+
+    @metrics.timed("card_qr")
+    def render_qr(self, url: str):
+        """صورة QR بمقاس مكانها في القالب، أو None إذا لم يوجد رابط أو مكان"""
+        if not url or not url.strip() or self.qr_slot is None:
+            return None
+        return generate_qr(url.strip(), self.qr_slot[2])
+
+    @metrics.timed("card_photo")
+    def paste_photo(self, card: Image.Image, photo: Image.Image):
+        """لصق الصورة الشخصية في مكانها (في نفس الصورة)"""
+        if self.photo_slot is None:
+            return
+        x, y, w, h, mask = self.photo_slot
+        if photo.size != (w, h):
+            photo = photo.resize((w, h), Image.LANCZOS)
+        card.paste(photo.convert("RGB"), (x, y), mask)
+
+    @metrics.timed("card_encode")
+    def encode(self, card: Image.Image) -> bytes:
+        out = self.output
+        dpi = out.get("dpi", 300)
+        buf = io.BytesIO()
+        card.save(buf, format=out.get("format", "JPEG"), quality=out.get("quality", 97),
+                  dpi=(dpi, dpi), optimize=out.get("optimize", False))
+        return buf.getvalue()
+
+
+# ── الترجمة ───────────────────────────────────────────────────
+def load_layout(name: str) -> dict:
+    with open(LAYOUTS_DIR / f"{name}.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def template_version(name: str, background_path: str) -> str:
+    """بصمة القالب: محتوى ملف التخطيط + حجم وتاريخ ملف الخلفية"""
+    h = hashlib.sha256((LAYOUTS_DIR / f"{name}.json").read_bytes())
+    st = os.stat(background_path)
+    h.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+
+@metrics.timed("card_compile")
+def compile_layout(layout: dict, background_path: str, output_scale: float = 1.0,
+                   version: str = "") -> RenderPlan:
+    """ترجمة وصف القالب إلى خطة رسم"""
+    tw, th = layout["size"]
+    out_w, out_h = int(tw * output_scale), int(th * output_scale)
+
+    # الخلفية
+    bg_spec = layout.get("background", {})
+    if bg_spec.get("kind") == "svg":
+        static = rasterize_svg(background_path, out_w, out_h).convert("RGB")
+    else:
+        static = Image.open(background_path).convert("RGB")
+        if output_scale != 1.0:
+            static = static.resize((int(static.width  * output_scale),
+                                    int(static.height * output_scale)), Image.LANCZOS)
+    s = static.width / tw   # معامل التحجيم
+
+    palette = {k: tuple(v) for k, v in layout.get("palette", {}).items()}
+    fonts   = {k: _find_font(v) for k, v in layout.get("fonts", {}).items()}
+    defaults = layout.get("defaults", {})
+    loaded  = {}
+
+    def op(spec):
+        spec  = {**defaults, **spec}
+        align = spec.get("align", "left")
+        if align not in _ALIGNS:
+            raise ValueError(f"محاذاة غير معروفة: {align}")
+        size  = int(spec["size"] * s)
+        key   = (spec["font"], size)
+        if key not in loaded:
+            loaded[key] = _font(fonts.get(spec["font"]), size)
+        color = spec.get("color", (0, 0, 0))
+        fill  = palette[color] if isinstance(color, str) else tuple(color)
+        return TextOp(int(spec["x"] * s), int(spec["y"] * s), align,
+                      loaded[key], fill, spec.get("shape", False))
+
+    # النصوص الثابتة تُرسم مرة واحدة في الطبقة الثابتة
+    draw = ImageDraw.Draw(static)
+    for spec in layout.get("static", []):
+        op(spec).draw(draw, spec["text"])
+
+    photo_slot = None
+    if "photo" in layout:
+        p = layout["photo"]
+        w, h = int(p["w"] * s), int(p["h"] * s)
+        photo_slot = (int(p["x"] * s), int(p["y"] * s), w, h,
+                      rounded_mask((w, h), int(p.get("radius", 0) * s)))
+
+    qr_slot = None
+    if "qr" in layout:
+        q = layout["qr"]
+        qr_slot = (int(q["x"] * s), int(q["y"] * s), int(q["size"] * s))
+
+    fields = {name: op(spec) for name, spec in layout.get("fields", {}).items()}
+    return RenderPlan(layout.get("name", ""), version, static, fields,
+                      photo_slot, qr_slot, layout.get("output", {}))
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_plan(name: str, background_path: str, output_scale: float, version: str) -> RenderPlan:
+    return compile_layout(load_layout(name), background_path, output_scale, version)
+
+
+def get_plan(name: str, background_path: str, output_scale: float = 1.0) -> RenderPlan:
+    """الخطة المترجمة للقالب — تُعاد ترجمتها فقط عند تغير ملف التخطيط أو الخلفية"""
+    version = template_version(name, background_path)
+    misses  = _cached_plan.cache_info().misses
+    plan    = _cached_plan(name, background_path, output_scale, version)
+    metrics.cache_lookup("card_plan", _cached_plan.cache_info().misses == misses)
+    return plan
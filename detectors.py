@@ -0,0 +1,33 @@
+"""
+detectors.py
+============
+مصنِّفات Haar لكشف الوجه — تُحمَّل مرة واحدة لكل عملية وتُشارك بين الطلبات.
+استدعاء detectMultiScale على نفس المصنِّف من عدة خيوط غير آمن في OpenCV،
+لذلك لكل مصنِّف قفل خاص به.
+"""
+
+import threading
+
+
+_CASCADES = {}
+_LOCK     = threading.Lock()
+
+
+def get_cascade(name: str):
+    """(المصنِّف، قفله) — مثال: get_cascade("haarcascade_frontalface_default.xml")"""
+    entry = _CASCADES.get(name)
+    if entry is None:
+        import cv2
+        with _LOCK:
+            entry = _CASCADES.get(name)
+            if entry is None:
+                entry = _CASCADES[name] = (
+                    cv2.CascadeClassifier(cv2.data.haarcascades + name), threading.Lock()
+                )
+    return entry
+
+
+def detect(name: str, gray, **params):
+    classifier, lock = get_cascade(name)
+    with lock:
+        return classifier.detectMultiScale(gray, **params)
@@ -0,0 +1,51 @@
+"""
+fal_backend.py
+==============
+نقطة واحدة لكل استدعاءات fal (إزالة الخلفية، رفع الدقة).
+
+عند ضبط FAL_STANDIN_URL (مثلاً http://127.0.0.1:8099) تُوجَّه الاستدعاءات
+إلى الخادم المحلي البديل fal_standin.py بنفس تدفق الطابور:
+  إرسال → متابعة الحالة → جلب النتيجة → تحميل الصورة من رابطها
+وإلا تُستعمل مكتبة fal_client العادية.
+"""
+
+import os
+import time
+
+import requests
+
+
+FAL_STANDIN_URL = os.getenv("FAL_STANDIN_URL", "").rstrip("/")
+_POLL_INTERVAL  = 0.05
+
+
+def _standin_subscribe(app_id: str, arguments: dict, timeout: float = 300) -> dict:
+    resp = requests.post(f"{FAL_STANDIN_URL}/{app_id}", json=arguments, timeout=30)
+    resp.raise_for_status()
+    handle   = resp.json()
+    deadline = time.monotonic() + timeout
+    while True:
+        status = requests.get(handle["status_url"], timeout=30)
+        status.raise_for_status()
+        if status.json()["status"] == "COMPLETED":
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{app_id}: انتهت مهلة الانتظار")
+        time.sleep(_POLL_INTERVAL)
+    result = requests.get(handle["response_url"], timeout=30)
+    result.raise_for_status()
+    return result.json()
+
+
+def subscribe(app_id: str, arguments: dict) -> dict:
+    """استدعاء متزامن (يُشغَّل عبر asyncio.to_thread)"""
+    if FAL_STANDIN_URL:
+        return _standin_subscribe(app_id, arguments)
+    import fal_client
+    return fal_client.subscribe(app_id, arguments=arguments)
+
+
+def fetch_image(url: str, timeout: float) -> bytes:
+    resp = requests.get(url, timeout=timeout)
+    resp.raise_for_status()
+    return resp.content
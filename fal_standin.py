@@ -0,0 +1,214 @@
+"""
+fal_standin.py
+==============
+خادم محلي بديل لـ fal لاختبارات الحمل — بدون مفتاح وبدون إنترنت.
+يحاكي تدفق الطابور (إرسال → حالة → نتيجة → رابط الصورة) لـ:
+  • fal-ai/birefnet/v2       → قناع ألفا ثابت: قطع ناقص حول الوجه + الكتفين
+  • fal-ai/clarity-upscaler  → تكبير LANCZOS بمعامل upscale_factor
+
+زمن الاستجابة يُسحب من توزيع log-normal (الوسيط، sigma) قابل للضبط،
+ونسبة الأخطاء قابلة للضبط لكل نموذج. نفس الصورة → نفس القناع دائماً.
+
+    python fal_standin.py --port 8099 --birefnet-latency 1.5,0.35 --upscale-latency 4,0.4 \\
+                          --birefnet-errors 0.01 --upscale-errors 0.02
+    FAL_STANDIN_URL=http://127.0.0.1:8099 uvicorn main:app --port 8000
+"""
+
+import io
+import json
+import math
+import time
+import uuid
+import base64
+import random
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+
+BIREFNET = "fal-ai/birefnet/v2"
+UPSCALER = "fal-ai/clarity-upscaler"
+
+_MAX_STORED = 512
+
+
+# ── النتائج المحاكاة ──────────────────────────────────────────
+def _decode_data_uri(uri: str) -> Image.Image:
+    payload = uri.split(",", 1)[1]
+    return Image.open(io.BytesIO(base64.b64decode(payload)))
+
+
+def _face_box(img: Image.Image):
+    """مربع الوجه عبر Haar إن توفر OpenCV، وإلا موضع تقديري ثابت"""
+    w, h = img.size
+    try:
+        import cv2
+        gray    = cv2.cvtColor(np.array(img.convert("RGB")), cv2.COLOR_RGB2GRAY)
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        faces   = cascade.detectMultiScale(gray, 1.1, 5, minSize=(50, 50))
+        if len(faces) > 0:
+            return tuple(int(v) for v in max(faces, key=lambda f: f[2] * f[3]))
+    except ImportError:
+        pass
+    fw, fh = int(w * 0.34), int(h * 0.34)
+    return (w - fw) // 2, int(h * 0.16), fw, fh
+
+
+def fake_cutout(img: Image.Image) -> bytes:
+    """قص ثابت: قطع ناقص أكبر قليلاً من الوجه (مع الشعر) + الكتفين، بحواف ناعمة"""
+    img  = img.convert("RGB")
+    w, h = img.size
+    fx, fy, fw, fh = _face_box(img)
+    cx   = fx + fw / 2
+    mask = Image.new("L", (w, h), 0)
+    d    = ImageDraw.Draw(mask)
+    d.ellipse([cx - fw * 0.75, fy - fh * 0.45, cx + fw * 0.75, fy + fh * 1.25], fill=255)
+    d.rectangle([cx - fw * 0.3, fy + fh, cx + fw * 0.3, fy + fh * 1.6], fill=255)
+    d.ellipse([cx - fw * 1.8, fy + fh * 1.45, cx + fw * 1.8, h + fh * 2], fill=255)
+    mask = mask.filter(ImageFilter.GaussianBlur(max(2, w // 300)))
+    out  = img.convert("RGBA")
+    out.putalpha(mask)
+    buf = io.BytesIO()
+    out.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def fake_upscale(img: Image.Image, factor: float) -> bytes:
+    img = img.convert("RGB")
+    img = img.resize((int(img.width * factor), int(img.height * factor)), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+# ── الحالة ────────────────────────────────────────────────────
+class StandIn:
+    def __init__(self, latency: dict, errors: dict, seed: int = 0):
+        self.latency = latency     # {app_id: (الوسيط بالثواني، sigma)}
+        self.errors  = errors      # {app_id: نسبة الأخطاء}
+        self.rng     = random.Random(seed)
+        self.lock    = threading.Lock()
+        self.jobs    = OrderedDict()   # request_id → dict
+        self.files   = OrderedDict()   # file_id → (bytes, content-type)
+
+    def _store(self, table, key, value):
+        with self.lock:
+            table[key] = value
+            while len(table) > _MAX_STORED:
+                table.popitem(last=False)
+
+    def submit(self, app_id: str, arguments: dict) -> str:
+        median, sigma = self.latency.get(app_id, (0.0, 0.0))
+        with self.lock:
+            delay  = self.rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+            failed = self.rng.random() < self.errors.get(app_id, 0.0)
+        request_id = uuid.uuid4().hex
+        self._store(self.jobs, request_id, {
+            "app_id": app_id, "arguments": arguments,
+            "ready_at": time.monotonic() + delay, "failed": failed,
+        })
+        return request_id
+
+    def status(self, request_id: str) -> str:
+        job = self.jobs[request_id]
+        return "COMPLETED" if time.monotonic() >= job["ready_at"] else "IN_PROGRESS"
+
+    def result(self, request_id: str, base_url: str) -> dict:
+        job = self.jobs[request_id]
+        if job["failed"]:
+            raise RuntimeError(f"{job['app_id']}: خطأ محاكى")
+        args = job["arguments"]
+        img  = _decode_data_uri(args["image_url"])
+        if job["app_id"] == UPSCALER:
+            data, ctype = fake_upscale(img, float(args.get("upscale_factor", 2))), "image/jpeg"
+        else:
+            data, ctype = fake_cutout(img), "image/png"
+        file_id = uuid.uuid4().hex
+        self._store(self.files, file_id, (data, ctype))
+        return {"image": {"url": f"{base_url}/files/{file_id}", "content_type": ctype}}
+
+
+# ── HTTP ──────────────────────────────────────────────────────
+def make_handler(state: StandIn):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _base_url(self):
+            return f"http://{self.headers.get('Host')}"
+
+        def _send(self, code, body: bytes, ctype="application/json"):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, code, obj):
+            self._send(code, json.dumps(obj).encode())
+
+        def do_POST(self):
+            app_id = self.path.lstrip("/")
+            if app_id not in (BIREFNET, UPSCALER):
+                return self._json(404, {"detail": f"unknown app {app_id}"})
+            length    = int(self.headers.get("Content-Length", 0))
+            arguments = json.loads(self.rfile.read(length))
+            rid       = state.submit(app_id, arguments)
+            base      = f"{self._base_url()}/requests/{rid}"
+            self._json(200, {"request_id": rid, "status_url": f"{base}/status",
+                             "response_url": base})
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            try:
+                if parts[0] == "files" and len(parts) == 2:
+                    data, ctype = state.files[parts[1]]
+                    return self._send(200, data, ctype)
+                if parts[0] == "requests" and len(parts) == 3 and parts[2] == "status":
+                    return self._json(200, {"status": state.status(parts[1])})
+                if parts[0] == "requests" and len(parts) == 2:
+                    return self._json(200, state.result(parts[1], self._base_url()))
+            except KeyError:
+                return self._json(404, {"detail": "not found"})
+            except RuntimeError as e:
+                return self._json(500, {"detail": str(e)})
+            self._json(404, {"detail": "not found"})
+
+    return Handler
+
+
+def _latency(value: str):
+    median, _, sigma = value.partition(",")
+    return float(median), float(sigma or 0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="خادم fal محلي بديل لاختبارات الحمل")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--birefnet-latency", type=_latency, default=(1.5, 0.3), help="الوسيط,sigma بالثواني")
+    ap.add_argument("--upscale-latency",  type=_latency, default=(4.0, 0.3), help="الوسيط,sigma بالثواني")
+    ap.add_argument("--birefnet-errors",  type=float, default=0.0)
+    ap.add_argument("--upscale-errors",   type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    state = StandIn(
+        latency={BIREFNET: args.birefnet_latency, UPSCALER: args.upscale_latency},
+        errors={BIREFNET: args.birefnet_errors, UPSCALER: args.upscale_errors},
+        seed=args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"fal stand-in on http://{args.host}:{args.port}  (FAL_STANDIN_URL)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+gunicorn.conf.py
+================
+تشغيل متعدد العمليات: gunicorn يحمّل التطبيق والأصول للقراءة فقط (الخلفيات،
+القوالب المترجمة، الخطوط، مصنِّفات الوجه) في العملية الرئيسية ثم ينسخ العمال
+بـ fork — فتُشارك هذه الذاكرة بينهم (copy-on-write) بدل نسخة لكل عامل.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+عدد العمال يُحسب تلقائياً من الأنوية المتاحة (مع حدود cgroup) ومن الذاكرة:
+    WEB_CONCURRENCY    عدد ثابت للعمال (يتجاوز الحساب التلقائي)
+    WORKER_MEMORY_MB   ذاكرة تقديرية خاصة بكل عامل للمعالجة (افتراضي 350)،
+                       تُضاف إليها طبقة الذاكرة لنتائج العامل RESULT_CACHE_MEMORY_MB (افتراضي 128)
+    MAX_REQUESTS       إعادة تدوير العامل بعد N طلب (افتراضي 1000، 0 = أبداً)
+
+المقاييس: كل عامل يكتب لقطة عداداته في METRICS_MULTIPROC_DIR (افتراضياً مجلد مؤقت
+جديد لكل تشغيل) و /metrics يجمع كل العمال — انظر metrics.py.
+"""
+
+import os
+import gc
+import glob
+import tempfile
+
+
+# قبل تحميل التطبيق (preload) حتى يقرأه metrics.py عند الاستيراد
+os.environ.setdefault("METRICS_MULTIPROC_DIR",
+                      os.path.join(tempfile.gettempdir(), f"photoadmin-metrics-{os.getpid()}"))
+os.makedirs(os.environ["METRICS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    # cgroup v2: "quota period" أو "max"
+    quota = _read("/sys/fs/cgroup/cpu.max")
+    if quota and not quota.startswith("max"):
+        q, p = quota.split()
+        cpus = min(cpus, max(1, int(int(q) / int(p))))
+    # cgroup v1
+    q, p = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if q and p and int(q) > 0:
+        cpus = min(cpus, max(1, int(int(q) / int(p))))
+    return cpus
+
+
+def available_memory_mb() -> int:
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read(path)
+        if value and value.isdigit() and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    meminfo = _read("/proc/meminfo") or ""
+    for line in meminfo.splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1]) // 1024
+    return 1024
+
+
+def auto_workers() -> int:
+    per_worker = (int(os.getenv("WORKER_MEMORY_MB", "350"))
+                  + int(os.getenv("RESULT_CACHE_MEMORY_MB", "128")))
+    by_memory  = int(available_memory_mb() * 0.85) // per_worker
+    return max(1, min(available_cpus(), by_memory))
+
+
+bind             = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers          = int(os.getenv("WEB_CONCURRENCY") or auto_workers())
+worker_class     = "uvicorn_worker.UvicornWorker"
+preload_app      = True
+
+# إعادة تدوير العمال تدريجياً (jitter يمنع إعادة تشغيلهم جميعاً في نفس اللحظة)
+max_requests        = int(os.getenv("MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+graceful_timeout    = 90     # وقت لإكمال الطلبات الجارية (رفع الدقة قد يستغرق دقيقة)
+timeout             = 180
+keepalive           = 5
+
+
+def on_starting(server):
+    """لقطات تشغيل سابق (والأرشيف) في نفس المجلد لا تُجمع مع هذا التشغيل"""
+    for path in glob.glob(os.path.join(os.environ["METRICS_MULTIPROC_DIR"], "*.json")):
+        os.unlink(path)
+
+
+def when_ready(server):
+    """بعد تحميل التطبيق في العملية الرئيسية وقبل إنشاء العمال"""
+    import main
+    main.preload_assets()
+    # نقل الكائنات الحالية إلى الجيل الدائم: جامع القمامة في العمال لا يلمسها
+    # فلا تُنسخ صفحاتها بسبب الكتابة
+    gc.collect()
+    gc.freeze()
+    server.log.info("assets preloaded: %s — %d workers", main.STARTUP["steps"], workers)
+
+
+def post_fork(server, worker):
+    """في العامل: بدء العد من الصفر (بدون قياسات التحميل المسبق) وكتابة اللقطات دورياً"""
+    import metrics
+    metrics.reset()
+    metrics.start_flusher()
+
+
+def child_exit(server, worker):
+    """ضم لقطة مقاييس العامل المنتهي إلى الأرشيف (بعد آخر كتابة منه عند الخروج)"""
+    import metrics
+    metrics.archive(worker.pid)
@@ -0,0 +1,195 @@
+"""
+loadtest.py
+===========
+مولّد حمل لنقاط النهاية: /api/biometric-photo، /preview، /api/family-card، /api/cnss-card
+بتزامن محدد، مع تقرير p50/p95/p99 والإنتاجية ونسبة الأخطاء لكل نقطة.
+
+للتشغيل بدون fal حقيقي:
+    python fal_standin.py --port 8099 &
+    FAL_STANDIN_URL=http://127.0.0.1:8099 uvicorn main:app --port 8000 &
+    python loadtest.py --url http://127.0.0.1:8000 --concurrency 8 --duration 60 \\
+                       --mix biometric=4,preview=2,family=1,cnss=1
+
+كل طلب فريد افتراضياً (تعليق JPEG فريد في الصورة، ورقم مرجع فريد لبطاقة CNSS
+والبطاقة العائلية) حتى لا تُجيب ذاكرة النتائج بدل المسار الكامل.
+--repeat-inputs يرسل نفس المدخلات دائماً لقياس مسار الإصابة (ETag/الذاكرة).
+بديل من جهة الخادم: RESULT_CACHE_MEMORY_MB=0 RESULT_CACHE_DISK_MB=0.
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image, ImageDraw
+
+
+# ── الطلبات ───────────────────────────────────────────────────
+FAMILY_FIELDS = {
+    "husband_name_ar": "محمد العلوي", "husband_name_fr": "MOHAMED ALAOUI",
+    "husband_cnie": "AB123456", "husband_birth_date": "01/01/1980",
+    "husband_birth_place": "الرباط", "husband_reg_num": "123/1980",
+    "wife_name_ar": "فاطمة بناني", "wife_name_fr": "FATIMA BENNANI",
+    "wife_cnie": "CD654321", "wife_birth_date": "02/02/1985",
+    "wife_birth_place": "فاس", "wife_reg_num": "456/1985",
+    "phone": "0600000000", "address_ar": "حي الرياض، الرباط", "address_fr": "Hay Riad, Rabat",
+    "reg_num_1": "789", "reg_num_2": "1011", "card_ref": "REF-0001",
+    "google_drive_url": "https://drive.google.com/file/d/0123456789abcdef/view",
+}
+
+CNSS_FIELDS = {
+    "reg_num": "906280021", "nom_ar": "العلوي", "prenom_ar": "محمد",
+    "birth_date": "01-01-1970", "cin": "AB123456", "reg_date": "08-02-2026",
+    "nom_fr": "ALAOUI", "prenom_fr": "MOHAMED",
+}
+
+# (المسار، حقل الملف، الحقول، الحقل الذي يُجعل فريداً لكل طلب)
+ENDPOINTS = {
+    "biometric": ("/api/biometric-photo", "file",
+                  {"doc_type": "cin", "bg_color": "gray", "layout": "4x2", "dpi": "300"}, None),
+    "preview":   ("/api/biometric-photo/preview", "file",
+                  {"doc_type": "cin", "bg_color": "gray"}, None),
+    "family":    ("/api/family-card", "photo", FAMILY_FIELDS, "card_ref"),
+    "cnss":      ("/api/cnss-card", None, CNSS_FIELDS, "reg_num"),
+}
+
+
+def default_photo() -> bytes:
+    """صورة شخصية بسيطة 1200×1600 عند عدم تمرير --photo"""
+    img = Image.new("RGB", (1200, 1600), (120, 140, 165))
+    d   = ImageDraw.Draw(img)
+    d.ellipse([180, 1100, 1020, 2100], fill=(40, 45, 60))
+    d.ellipse([396, 256, 804, 800], fill=(214, 170, 140))
+    for ex in (518, 682):
+        d.ellipse([ex - 30, 500, ex + 30, 530], fill=(40, 30, 25))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+def with_nonce(photo: bytes, nonce: str) -> bytes:
+    """نفس الصورة مع مقطع تعليق JPEG (COM) بعد SOI — بصمة مختلفة، نفس البكسلات"""
+    comment = nonce.encode()
+    return photo[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + photo[2:]
+
+
+# ── التشغيل ───────────────────────────────────────────────────
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)   # nearest-rank
+    return sorted_values[k]
+
+
+def parse_mix(value: str) -> list:
+    order = []
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"نقطة غير معروفة: {name}")
+        order += [name] * int(weight or 1)
+    return order
+
+
+def run(url, mix, concurrency, duration, total, photo, timeout, repeat_inputs=False):
+    results = []   # (الاسم، الزمن، ناجح، الحالة)
+    run_id  = os.urandom(4).hex()   # فريد بين التشغيلات أيضاً (ذاكرة القرص تبقى بينها)
+    lock    = threading.Lock()
+    counter = iter(range(total)) if total else None
+    t_start = time.perf_counter()
+    t_end   = t_start + duration if duration else None
+
+    def worker(worker_id):
+        session = requests.Session()
+        i = worker_id
+        while True:
+            if counter is not None:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+            elif time.perf_counter() >= t_end:
+                return
+            name = mix[i % len(mix)]
+            path, file_field, fields, unique_field = ENDPOINTS[name]
+            body = photo
+            if not repeat_inputs:
+                nonce = f"{run_id}-{i}"   # i فريد بين العمال: worker_id + k × concurrency
+                if file_field:
+                    body = with_nonce(photo, nonce)
+                if unique_field:
+                    fields = {**fields, unique_field: nonce}
+            i += concurrency
+            files = {file_field: ("photo.jpg", body, "image/jpeg")} if file_field else None
+            t0 = time.perf_counter()
+            try:
+                resp   = session.post(url + path, data=fields, files=files, timeout=timeout)
+                status = resp.status_code
+                ok     = status == 200
+            except requests.RequestException:
+                status, ok = 0, False
+            with lock:
+                results.append((name, time.perf_counter() - t0, ok, status))
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return results, time.perf_counter() - t_start
+
+
+def summarize(results, wall) -> dict:
+    report = {}
+    for name in sorted({r[0] for r in results}) + ["ALL"]:
+        rows = [r for r in results if name == "ALL" or r[0] == name]
+        lat  = sorted(r[1] for r in rows if r[2])
+        errs = sum(1 for r in rows if not r[2])
+        report[name] = {
+            "requests":   len(rows),
+            "errors":     errs,
+            "error_rate": errs / len(rows) if rows else 0.0,
+            "throughput": len(rows) / wall if wall else 0.0,
+            "p50":        percentile(lat, 50),
+            "p95":        percentile(lat, 95),
+            "p99":        percentile(lat, 99),
+            "statuses":   {str(s): sum(1 for r in rows if r[3] == s) for s in {r[3] for r in rows}},
+        }
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="اختبار حمل لخدمة PhotoAdmin")
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--duration", type=float, default=30, help="بالثواني (يُتجاهل مع --requests)")
+    ap.add_argument("--requests", type=int, default=0, help="عدد الطلبات الكلي")
+    ap.add_argument("--mix", type=parse_mix, default=parse_mix("biometric=4,preview=2,family=1,cnss=1"))
+    ap.add_argument("--photo", help="صورة الاختبار (افتراضياً صورة اصطناعية)")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--repeat-inputs", action="store_true",
+                    help="نفس المدخلات لكل الطلبات (قياس إصابات ذاكرة النتائج)")
+    ap.add_argument("--json", help="حفظ التقرير في ملف JSON")
+    args = ap.parse_args()
+
+    photo = open(args.photo, "rb").read() if args.photo else default_photo()
+    results, wall = run(args.url.rstrip("/"), args.mix, args.concurrency,
+                        args.duration, args.requests, photo, args.timeout, args.repeat_inputs)
+    report = summarize(results, wall)
+
+    print(f"concurrency={args.concurrency}  wall={wall:.1f}s")
+    print(f"{'endpoint':<10} {'reqs':>6} {'err%':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, r in report.items():
+        print(f"{name:<10} {r['requests']:>6} {r['error_rate'] * 100:>5.1f}% {r['throughput']:>7.2f} "
+              f"{r['p50']:>7.2f}s {r['p95']:>7.2f}s {r['p99']:>7.2f}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"concurrency": args.concurrency, "wall_s": wall, "endpoints": report}, f, indent=2)
+    return 1 if not results else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,39 @@
+import time
+_T_IMPORT = time.perf_counter()
+
 import os
 import io
+import json
 import base64
 import asyncio
-import requests
-import cv2
-import numpy as np
-import qrcode
+import zipfile
+from contextlib import asynccontextmanager
 from PIL import Image, ImageEnhance, ImageFilter
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import Response
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
+from fastapi.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import fal_client
-from family_card_api import generate_family_card
+import metrics
+import detectors
+import fal_backend
+import result_cache
+from card_engine import get_plan, template_version
+from family_card_api import generate_family_card, crop_face
+
+# المكتبات الثقيلة (cv2، numpy، qrcode، cairosvg، fal_client) تُستورد عند أول استعمال
+# أو أثناء الإحماء — مسار الاستيراد نفسه يبقى خفيفاً لتسريع الإقلاع.
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # الإحماء في الخلفية: الخادم يقبل الاتصالات فوراً و /api/ready يرجع 503 حتى ينتهي بنجاح
+    if not STARTUP["ready"]:
+        app.state.warmup = asyncio.get_running_loop().run_in_executor(None, warmup)
+    yield
 
-app = FastAPI(title="PhotoAdmin API", version="3.0.0")
 
+app = FastAPI(title="PhotoAdmin API", version="3.0.0", lifespan=lifespan)
+
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -44,6 +63,31 @@ LAYOUTS = {
     "1x1": {"cols": 1, "rows": 1},
 }
 
+# صيغ الإخراج المدعومة: (صيغة PIL، نوع MIME، الامتداد)
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+    "png":  ("PNG",  "image/png",  "png"),
+}
+
+MAX_BATCH_OUTPUTS = 12
+
+BASE_DIR        = os.path.dirname(os.path.abspath(__file__))
+FAMILY_SVG_PATH = os.path.join(BASE_DIR, "family_card_template.svg")
+CNSS_BG_PATH    = next(
+    (p for p in (os.path.join(BASE_DIR, n) for n in ("AMO_IAM_PNG.png", "AMO IAM PNG.png"))
+     if os.path.exists(p)),
+    os.path.join(BASE_DIR, "AMO_IAM_PNG.png"),
+)
+
+FACE_CASCADES = [
+    "haarcascade_frontalface_alt2.xml",
+    "haarcascade_frontalface_default.xml",
+    "haarcascade_frontalface_alt_tree.xml",
+]
+
+# تُضمَّن في مفتاح ذاكرة النتائج — غيّرها عند تعديل خطوات المعالجة
+PIPELINE_VERSION = "3.0.2"
+
 # معايير ICAO
 FACE_HEIGHT_RATIO = 0.75   # الوجه يشغل 75% من ارتفاع الصورة
 HEADROOM_RATIO    = 0.04   # 10% مسافة فوق الرأس
@@ -53,19 +97,16 @@ def mm_to_px(mm, dpi):
     return int(mm / 25.4 * dpi)
 
 
+@metrics.timed("detect_face")
 def detect_face(img_rgb):
     """كشف الوجه بثلاث محاولات متتالية"""
+    import cv2
     gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
     gray = cv2.equalizeHist(gray)
 
-    for cascade_name in [
-        "haarcascade_frontalface_alt2.xml",
-        "haarcascade_frontalface_default.xml",
-        "haarcascade_frontalface_alt_tree.xml",
-    ]:
-        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + cascade_name)
-        faces = cascade.detectMultiScale(
-            gray, scaleFactor=1.05, minNeighbors=3, minSize=(50, 50)
+    for cascade_name in FACE_CASCADES:
+        faces = detectors.detect(
+            cascade_name, gray, scaleFactor=1.05, minNeighbors=3, minSize=(50, 50)
         )
         if len(faces) > 0:
             return sorted(faces, key=lambda f: f[2] * f[3], reverse=True)[0]
@@ -73,16 +114,21 @@ def detect_face(img_rgb):
     return None
 
 
-def face_aware_crop(img, target_w, target_h, zoom=1.0):
+@metrics.timed("face_aware_crop")
+def face_aware_crop(img, target_w, target_h, zoom=1.0, face=...):
     """
     القص الذكي — zoom يعمل بشكل صحيح:
       zoom=1.0 → الوجه يشغل 75% (معيار ICAO)
       zoom>1.0 → اقتراب أكثر (الوجه يشغل مساحة أكبر)
       zoom<1.0 → ابتعاد أكثر (يظهر الجسم أكثر)
+    face: مربع وجه محسوب مسبقاً (أو None = بدون وجه)؛ الافتراضي ... = الكشف هنا
     """
+    import cv2
+    import numpy as np
     img_rgb = np.array(img.convert("RGB"))
     ih, iw  = img_rgb.shape[:2]
-    face    = detect_face(img_rgb)
+    if face is ...:
+        face = detect_face(img_rgb)
 
     if face is not None:
         fx, fy, fw, fh = face
@@ -132,6 +178,7 @@ def face_aware_crop(img, target_w, target_h, zoom=1.0):
     return Image.fromarray(result)
 
 
+@metrics.timed("enhance_photo")
 def enhance_photo(img: Image.Image) -> Image.Image:
     """تحسين الجودة: سطوع، تباين، حدة — مظهر الاستوديو الاحترافي"""
     img = ImageEnhance.Brightness(img).enhance(1.08)
@@ -142,6 +189,7 @@ def enhance_photo(img: Image.Image) -> Image.Image:
     return img
 
 
+@metrics.timed("build_sheet")
 def build_sheet(photo, cols, rows, pad):
     W = photo.width * cols + pad * (cols + 1)
     H = photo.height * rows + pad * (rows + 1)
@@ -155,28 +203,83 @@ def build_sheet(photo, cols, rows, pad):
     return sheet
 
 
+@metrics.timed("encode")
+def encode_image(img: Image.Image, fmt: str = "jpeg", dpi: int = None, quality: int = 97) -> bytes:
+    """ترميز الصورة بالصيغة المطلوبة"""
+    pil_format = OUTPUT_FORMATS[fmt][0]
+    params = {"dpi": (dpi, dpi)} if dpi else {}
+    if pil_format == "JPEG":
+        params["quality"] = quality
+    buf = io.BytesIO()
+    img.save(buf, format=pil_format, **params)
+    return buf.getvalue()
+
+
+def parse_output_specs(raw_specs: str) -> list:
+    """قراءة قائمة المخرجات (JSON) والتحقق من كل عنصر"""
+    try:
+        specs = json.loads(raw_specs)
+    except ValueError:
+        raise HTTPException(400, "outputs يجب أن يكون JSON صالحاً")
+    if not isinstance(specs, list) or not specs:
+        raise HTTPException(400, "outputs يجب أن يكون قائمة غير فارغة")
+    if len(specs) > MAX_BATCH_OUTPUTS:
+        raise HTTPException(400, f"الحد الأقصى {MAX_BATCH_OUTPUTS} مخرجات في الطلب الواحد")
+
+    parsed = []
+    for spec in specs:
+        if not isinstance(spec, dict):
+            raise HTTPException(400, "كل عنصر في outputs يجب أن يكون كائناً")
+        spec = {
+            "doc_type": spec.get("doc_type", "cin"),
+            "bg_color": spec.get("bg_color", "gray"),
+            "layout":   spec.get("layout",   "4x2"),
+            "dpi":      spec.get("dpi",      300),
+            "format":   spec.get("format",   "jpeg"),
+        }
+        # التحقق من النوع أولاً: قيمة غير قابلة للتجزئة (قائمة، كائن) تُسقط "in" بخطأ 500
+        for field in ("doc_type", "bg_color", "layout", "format"):
+            if not isinstance(spec[field], str):
+                raise HTTPException(400, f"{field} يجب أن يكون نصاً")
+        if not isinstance(spec["dpi"], int) or isinstance(spec["dpi"], bool):
+            raise HTTPException(400, "dpi يجب أن يكون عدداً صحيحاً")
+        spec["format"] = spec["format"].lower()
+        if spec["doc_type"] not in PHOTO_SIZES:    raise HTTPException(400, "doc_type غير مدعوم")
+        if spec["bg_color"] not in BG_COLORS:      raise HTTPException(400, "bg_color غير مدعوم")
+        if spec["layout"]   not in LAYOUTS:        raise HTTPException(400, "layout غير مدعوم")
+        if spec["dpi"] not in (150, 300, 600):     raise HTTPException(400, "dpi غير مدعوم")
+        if spec["format"]   not in OUTPUT_FORMATS: raise HTTPException(400, "format غير مدعوم")
+        parsed.append(spec)
+    return parsed
+
+
+@metrics.timed("fal_remove_bg")
 async def fal_remove_bg(image_bytes):
     b64      = base64.b64encode(image_bytes).decode()
     data_uri = f"data:image/jpeg;base64,{b64}"
     try:
-        result = await asyncio.to_thread(
-            fal_client.subscribe,
-            "fal-ai/birefnet/v2",
-            arguments={
-                "image_url":            data_uri,
-                "model":                "Portrait",
-                "operating_resolution": "1024x1024",
-            },
-        )
-        resp = requests.get(result["image"]["url"], timeout=30)
-        resp.raise_for_status()
-        return Image.open(io.BytesIO(resp.content)).convert("RGBA")
+        with metrics.remote_call("birefnet"):
+            result = await asyncio.to_thread(
+                fal_backend.subscribe,
+                "fal-ai/birefnet/v2",
+                {
+                    "image_url":            data_uri,
+                    "model":                "Portrait",
+                    "operating_resolution": "1024x1024",
+                },
+            )
+            content = await asyncio.to_thread(fal_backend.fetch_image, result["image"]["url"], 30)
+        return Image.open(io.BytesIO(content)).convert("RGBA")
     except Exception as e:
         raise HTTPException(500, f"خطأ في إزالة الخلفية: {str(e)}")
 
 
-async def fal_upscale(image_bytes: bytes, target_w: int, target_h: int) -> Image.Image:
-    """رفع الدقة إلى 4K"""
+@metrics.timed("fal_upscale")
+async def fal_upscale(image_bytes: bytes, target_w: int, target_h: int) -> tuple:
+    """
+    رفع الدقة إلى 4K → (الصورة، نجح رفع الدقة).
+    عند فشل fal تُرجع الصورة مكبرة محلياً (LANCZOS) مع False — نتيجة مؤقتة لا تُخزن.
+    """
     b64      = base64.b64encode(image_bytes).decode()
     data_uri = f"data:image/jpeg;base64,{b64}"
     PROMPT = (
@@ -186,26 +289,69 @@ async def fal_upscale(image_bytes: bytes, target_w: int, target_h: int) -> Image
         "No smoothing, no plastic skin, no face modification whatsoever."
     )
     try:
-        result = await asyncio.to_thread(
-            fal_client.subscribe,
-            "fal-ai/clarity-upscaler",
-            arguments={
-                "image_url":      data_uri,
-                "prompt":         PROMPT,
-                "upscale_factor": 2,
-                "creativity":     0,
-                "resemblance":    1.0,
-            },
-        )
-        resp = requests.get(result["image"]["url"], timeout=60)
-        resp.raise_for_status()
-        return Image.open(io.BytesIO(resp.content)).convert("RGB").resize(
-            (target_w, target_h), Image.LANCZOS
-        )
+        with metrics.remote_call("clarity_upscaler"):
+            result = await asyncio.to_thread(
+                fal_backend.subscribe,
+                "fal-ai/clarity-upscaler",
+                {
+                    "image_url":      data_uri,
+                    "prompt":         PROMPT,
+                    "upscale_factor": 2,
+                    "creativity":     0,
+                    "resemblance":    1.0,
+                },
+            )
+            content = await asyncio.to_thread(fal_backend.fetch_image, result["image"]["url"], 60)
+        return await asyncio.to_thread(_decode_resized, content, target_w, target_h), True
     except Exception:
-        return Image.open(io.BytesIO(image_bytes)).convert("RGB").resize(
-            (target_w, target_h), Image.LANCZOS
-        )
+        return await asyncio.to_thread(_decode_resized, image_bytes, target_w, target_h), False
+
+
+def _decode_resized(data: bytes, target_w: int, target_h: int) -> Image.Image:
+    return Image.open(io.BytesIO(data)).convert("RGB").resize((target_w, target_h), Image.LANCZOS)
+
+
+async def cached_response(request: Request, key: str, media_type: str, filename: str = None):
+    """
+    304 إذا طابق If-None-Match، أو النتيجة المخزنة، أو None عند عدم الإصابة.
+    key: result_cache.make_key(...) لكل مدخلات الطلب
+    """
+    tag    = result_cache.etag(key)
+    header = request.headers.get("if-none-match")
+    if result_cache.if_none_match(header, tag):   # ETag محدد: بدون قراءة الذاكرة
+        return not_modified_response(tag)
+    data = await asyncio.to_thread(result_cache.RESULTS.get, key)
+    if data is None:
+        return None
+    if result_cache.if_none_match(header, tag, stored=True):   # * مع نتيجة موجودة
+        return not_modified_response(tag)
+    return result_response(key, data, media_type, filename)
+
+
+def not_modified_response(tag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "no-cache"})
+
+
+async def store_response(key: str, data: bytes, media_type: str, filename: str = None,
+                         cache: bool = True) -> Response:
+    """
+    تخزين النتيجة وإرجاعها مع ETag.
+    cache=False لنتيجة متدهورة (فشل رفع الدقة): تُرجع بدون تخزين وبدون ETag،
+    فالطلب التالي بنفس المدخلات يعيد المحاولة بدل تثبيت النسخة المؤقتة.
+    """
+    if not cache:
+        return result_response(None, data, media_type, filename)
+    await asyncio.to_thread(result_cache.RESULTS.put, key, data)
+    return result_response(key, data, media_type, filename)
+
+
+def result_response(key: str, data: bytes, media_type: str, filename: str = None) -> Response:
+    headers = {"Cache-Control": "no-cache"}
+    if key:
+        headers["ETag"] = result_cache.etag(key)
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return Response(content=data, media_type=media_type, headers=headers)
 
 
 # ── نقاط النهاية ──────────────────────────────────────────────
@@ -217,11 +363,27 @@ async def root():
 
 @app.get("/api/health")
 async def health():
-    return {"status": "ok", "fal_configured": bool(os.getenv("FAL_KEY")), "version": "3.0.0"}
+    return {"status": "ok", "fal_configured": bool(os.getenv("FAL_KEY")),
+            "fal_standin": bool(fal_backend.FAL_STANDIN_URL), "version": "3.0.0"}
+
+
+@app.get("/api/ready")
+async def ready():
+    """
+    جاهزية الخدمة: 503 حتى ينتهي الإحماء بدون أخطاء وبكل الأصول المطلوبة،
+    مع أزمنة الاستيراد والإحماء وخطأ كل خطوة فشلت
+    """
+    return JSONResponse(STARTUP, status_code=200 if STARTUP["ready"] else 503)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/api/biometric-photo")
 async def biometric_photo(
+    request:  Request,
     file:     UploadFile = File(...),
     doc_type: str   = Form("cin"),
     bg_color: str   = Form("gray"),
@@ -239,6 +401,15 @@ async def biometric_photo(
     if len(raw) > 15 * 1024 * 1024:
         raise HTTPException(400, "حجم الصورة أكبر من 15MB")
 
+    filename = f"photo_{doc_type}_{layout}.jpg"
+    key = result_cache.make_key("biometric-photo", {
+        "doc_type": doc_type, "bg_color": bg_color, "layout": layout,
+        "dpi": dpi, "zoom": zoom, "upscale": upscale,
+    }, raw, PIPELINE_VERSION)
+    cached = await cached_response(request, key, "image/jpeg", filename)
+    if cached is not None:
+        return cached
+
     # 1. إزالة الخلفية
     cutout = await fal_remove_bg(raw)
 
@@ -256,33 +427,160 @@ async def biometric_photo(
     photo = enhance_photo(photo)
 
     # 5. رفع الدقة 4K
+    upscaled = True
     if upscale or dpi >= 300:
-        buf_tmp = io.BytesIO()
-        photo.save(buf_tmp, format="JPEG", quality=97)
-        photo = await fal_upscale(buf_tmp.getvalue(), tw, th)
+        photo, upscaled = await fal_upscale(encode_image(photo, "jpeg"), tw, th)
 
     # 6. لوحة الطباعة
     lyt   = LAYOUTS[layout]
     sheet = build_sheet(photo, lyt["cols"], lyt["rows"], mm_to_px(3, dpi))
 
-    buf = io.BytesIO()
-    sheet.save(buf, format="JPEG", quality=97, dpi=(dpi, dpi))
+    return await store_response(key, encode_image(sheet, "jpeg", dpi=dpi), "image/jpeg", filename,
+                                cache=upscaled)
+
 
-    return Response(
-        content=buf.getvalue(),
-        media_type="image/jpeg",
-        headers={"Content-Disposition": f'attachment; filename="photo_{doc_type}_{layout}.jpg"'},
+@app.post("/api/biometric-photo/batch")
+async def biometric_photo_batch(
+    request: Request,
+    file:    UploadFile = File(...),
+    outputs: str   = Form(...),
+    zoom:    float = Form(1.0),
+    upscale: bool  = Form(True),
+):
+    """
+    عدة مخرجات من صورة واحدة: المراحل المكلفة (إزالة الخلفية، كشف الوجه، القص،
+    رفع الدقة) تُنفذ مرة واحدة لكل مقاس بأعلى دقة مطلوبة — مهما تعددت ألوان الخلفية.
+    الصورة الرئيسية هي الشخص مضروباً في الشفافية (على أسود) مع قناعه بنفس القص،
+    فكل لون = premult + لون × (1 − α) بدون حافة من لون آخر، ثم يُحسَّن كل لون
+    على حدة. النتيجة لا تتعلق بترتيب المخرجات. ثم يُشتق كل مخرج بتصغير + لوحة + ترميز.
+    النتيجة ملف ZIP.
+    outputs: '[{"doc_type": "cin", "layout": "4x2", "dpi": 300, "bg_color": "gray", "format": "jpeg"}, ...]'
+    """
+    specs = parse_output_specs(outputs)
+
+    raw = await file.read()
+    if len(raw) > 15 * 1024 * 1024:
+        raise HTTPException(400, "حجم الصورة أكبر من 15MB")
+
+    key = result_cache.make_key("biometric-batch", {
+        "outputs": specs, "zoom": zoom, "upscale": upscale,
+    }, raw, PIPELINE_VERSION)
+    cached = await cached_response(request, key, "application/zip", "photos.zip")
+    if cached is not None:
+        return cached
+
+    # 1. إزالة الخلفية — مرة واحدة
+    cutout = await fal_remove_bg(raw)
+
+    # كل العمل الحسابي في خيوط (asyncio.to_thread) — حلقة الأحداث تبقى حرة للطلبات الأخرى
+    import numpy as np
+
+    # 2. كشف الوجه — مرة واحدة، على تركيب بلون ثابت (لا يتعلق بترتيب المخرجات)
+    def prepare():
+        probe_bg = Image.new("RGBA", cutout.size, (*BG_COLORS["gray"], 255))
+        face     = detect_face(np.array(Image.alpha_composite(probe_bg, cutout).convert("RGB")))
+        black    = Image.new("RGBA", cutout.size, (0, 0, 0, 255))
+        premult  = Image.alpha_composite(black, cutout).convert("RGB")
+        return face, premult, cutout.getchannel("A")
+
+    face, premult, matte = await asyncio.to_thread(prepare)
+
+    # 3. صورة رئيسية لكل مقاس بأعلى دقة مطلوبة: قص + رفع دقة مرة واحدة
+    groups = {}
+    for spec in specs:
+        size  = PHOTO_SIZES[spec["doc_type"]]
+        group = (size["width_mm"], size["height_mm"])
+        groups[group] = max(groups.get(group, 0), spec["dpi"])
+
+    def crop_master(tw, th, encode):
+        photo = face_aware_crop(premult, tw, th, zoom=zoom, face=face)
+        mask  = face_aware_crop(matte, tw, th, zoom=zoom, face=face).convert("L")
+        return photo, mask, encode_image(photo, "jpeg") if encode else None
+
+    async def render_master(width_mm, height_mm, dpi):
+        tw     = mm_to_px(width_mm,  dpi)
+        th     = mm_to_px(height_mm, dpi)
+        remote = upscale or dpi >= 300
+        photo, mask, jpeg = await asyncio.to_thread(crop_master, tw, th, remote)
+        upscaled = True
+        if remote:
+            photo, upscaled = await fal_upscale(jpeg, tw, th)
+        return photo, mask, upscaled
+
+    rendered = await asyncio.gather(
+        *(render_master(*group, dpi) for group, dpi in groups.items())
     )
+    masters  = {group: (photo, mask) for group, (photo, mask, _) in zip(groups, rendered)}
+    upscaled = all(ok for _, _, ok in rendered)
+
+    # 4. لكل (مقاس، لون): تركيب الخلفية + تحسين بدقة الصورة الرئيسية، ثم تصغير لكل دقة
+    coloured = {}   # (مقاس، لون) → صورة محسّنة
+    derived  = {}   # (مقاس، دقة، لون) → صورة — مشتركة بين التخطيطات والصيغ
+
+    def derive(group, dpi, bg_color):
+        if (group, bg_color) not in coloured:
+            photo, mask = masters[group]
+            alpha = np.asarray(mask, np.float32)[..., None] / 255
+            rgb   = np.asarray(photo, np.float32) + np.float32(BG_COLORS[bg_color]) * (1 - alpha)
+            coloured[(group, bg_color)] = enhance_photo(
+                Image.fromarray(np.clip(np.rint(rgb), 0, 255).astype(np.uint8)))
+        photo = coloured[(group, bg_color)]
+        tw    = mm_to_px(group[0], dpi)
+        th    = mm_to_px(group[1], dpi)
+        if photo.size != (tw, th):
+            photo = photo.resize((tw, th), Image.LANCZOS)
+        return photo
+
+    def build_zip():
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+            for spec in specs:
+                size  = PHOTO_SIZES[spec["doc_type"]]
+                dpi   = spec["dpi"]
+                ext   = OUTPUT_FORMATS[spec["format"]][2]
+                name  = f'photo_{spec["doc_type"]}_{spec["layout"]}_{dpi}dpi_{spec["bg_color"]}.{ext}'
+                if name in zf.NameToInfo:   # مخرج مكرر — لا داعي للتصغير واللوحة والترميز
+                    continue
+
+                variant = ((size["width_mm"], size["height_mm"]), dpi, spec["bg_color"])
+                if variant not in derived:
+                    derived[variant] = derive(*variant)
+                photo = derived[variant]
+
+                lyt   = LAYOUTS[spec["layout"]]
+                sheet = build_sheet(photo, lyt["cols"], lyt["rows"], mm_to_px(3, dpi))
+                # تاريخ ثابت: نفس المدخلات → نفس بايتات الأرشيف (ETag قوي)
+                info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+                info.external_attr = 0o644 << 16
+                zf.writestr(info, encode_image(sheet, spec["format"], dpi=dpi))
+        return buf.getvalue()
+
+    return await store_response(key, await asyncio.to_thread(build_zip), "application/zip",
+                                "photos.zip", cache=upscaled)
 
 
 @app.post("/api/biometric-photo/preview")
 async def biometric_preview(
+    request:  Request,
     file:     UploadFile = File(...),
     doc_type: str   = Form("cin"),
     bg_color: str   = Form("gray"),
     zoom:     float = Form(1.0),
 ):
+    if doc_type not in PHOTO_SIZES: raise HTTPException(400, "doc_type غير مدعوم")
+    if bg_color not in BG_COLORS:   raise HTTPException(400, "bg_color غير مدعوم")
+
     raw    = await file.read()
+    if len(raw) > 15 * 1024 * 1024:
+        raise HTTPException(400, "حجم الصورة أكبر من 15MB")
+
+    key    = result_cache.make_key("biometric-preview", {
+        "doc_type": doc_type, "bg_color": bg_color, "zoom": zoom,
+    }, raw, PIPELINE_VERSION)
+    cached = await cached_response(request, key, "image/jpeg")
+    if cached is not None:
+        return cached
+
     cutout = await fal_remove_bg(raw)
     bg     = Image.new("RGBA", cutout.size, (*BG_COLORS[bg_color], 255))
     final  = Image.alpha_composite(bg, cutout).convert("RGB")
@@ -291,13 +589,12 @@ async def biometric_preview(
     ph     = mm_to_px(size["height_mm"], 150)
     photo  = face_aware_crop(final, pw, ph, zoom=zoom)
     photo  = enhance_photo(photo)
-    buf    = io.BytesIO()
-    photo.save(buf, format="JPEG", quality=88)
-    return Response(content=buf.getvalue(), media_type="image/jpeg")
+    return await store_response(key, encode_image(photo, "jpeg", quality=88), "image/jpeg")
 
 
 @app.post("/api/family-card")
 async def family_card_endpoint(
+    request:             Request,
     photo:               UploadFile = File(...),
     husband_name_ar:     str = Form(""),
     husband_name_fr:     str = Form(""),
@@ -319,10 +616,18 @@ async def family_card_endpoint(
     card_ref:            str = Form(""),
     google_drive_url:    str = Form(""),
 ):
-    SVG_TEMPLATE = os.path.join(os.path.dirname(__file__), "family_card_template.svg")
-    if not os.path.exists(SVG_TEMPLATE):
+    if not os.path.exists(FAMILY_SVG_PATH):
         raise HTTPException(500, "ملف القالب غير موجود على السيرفر")
 
+    fields = {k: v for k, v in locals().items() if isinstance(v, str)}
+    raw    = await photo.read()
+    await photo.seek(0)
+    key    = result_cache.make_key("family-card", fields, raw,
+                                   template_version("family", FAMILY_SVG_PATH))
+    cached = await cached_response(request, key, "image/jpeg", "family_card.jpg")
+    if cached is not None:
+        return cached
+
     jpg_bytes = await generate_family_card(
         photo=photo,
         husband_name_ar=husband_name_ar,
@@ -344,14 +649,10 @@ async def family_card_endpoint(
         reg_num_2=reg_num_2,
         card_ref=card_ref,
         google_drive_url=google_drive_url,
-        svg_template_path=SVG_TEMPLATE,
+        svg_template_path=FAMILY_SVG_PATH,
     )
 
-    return Response(
-        content=jpg_bytes,
-        media_type="image/jpeg",
-        headers={"Content-Disposition": 'attachment; filename="family_card.jpg"'},
-    )
+    return await store_response(key, jpg_bytes, "image/jpeg", "family_card.jpg")
 
 
 # ══════════════════════════════════════════════════════════════
@@ -361,6 +662,7 @@ from cnss_card_api import generate_cnss_card
 
 @app.post("/api/cnss-card")
 async def cnss_card_endpoint(
+    request:    Request,
     reg_num:    str = Form(""),   # رقم التسجيل
     nom_ar:     str = Form(""),   # الاسم العائلي عربي
     prenom_ar:  str = Form(""),   # الاسم الشخصي عربي
@@ -370,10 +672,16 @@ async def cnss_card_endpoint(
     nom_fr:     str = Form(""),   # Nom français
     prenom_fr:  str = Form(""),   # Prénom français
 ):
-    BG_PATH = os.path.join(os.path.dirname(__file__), "AMO_IAM_PNG.png")
-    if not os.path.exists(BG_PATH):
+    if not os.path.exists(CNSS_BG_PATH):
         raise HTTPException(500, "ملف خلفية CNSS غير موجود على السيرفر")
 
+    fields = {k: v for k, v in locals().items() if isinstance(v, str)}
+    key    = result_cache.make_key("cnss-card", fields,
+                                   version=template_version("cnss", CNSS_BG_PATH))
+    cached = await cached_response(request, key, "image/jpeg", "cnss_card.jpg")
+    if cached is not None:
+        return cached
+
     jpg_bytes = generate_cnss_card(
         reg_num=reg_num,
         nom_ar=nom_ar,
@@ -383,11 +691,111 @@ async def cnss_card_endpoint(
         reg_date=reg_date,
         nom_fr=nom_fr,
         prenom_fr=prenom_fr,
-        bg_path=BG_PATH,
+        bg_path=CNSS_BG_PATH,
     )
 
-    return Response(
-        content=jpg_bytes,
-        media_type="image/jpeg",
-        headers={"Content-Disposition": 'attachment; filename="cnss_card.jpg"'},
-    )
+    return await store_response(key, jpg_bytes, "image/jpeg", "cnss_card.jpg")
+
+
+# ══════════════════════════════════════════════════════════════
+#  الإقلاع: تحميل الأصول + إحماء كل المسارات
+#  WARMUP=0 يعطّل الإحماء (الخدمة جاهزة فوراً)
+#  الأصل الغائب يُسجل كتحذير (warnings) ولا يمنع الجاهزية — نقطة النهاية الخاصة به
+#  وحدها ترجع 500. WARMUP_REQUIRED="family,cnss" يجعل غيابه فشلاً (503) في بيئة تنشره.
+# ══════════════════════════════════════════════════════════════
+EXPECTED_ASSETS = {
+    "cnss":   CNSS_BG_PATH,
+    "family": FAMILY_SVG_PATH,
+}
+
+STARTUP = {
+    "ready":          os.getenv("WARMUP", "1") == "0",
+    "import_seconds": None,
+    "warmup_seconds": None,
+    "steps":          {},
+    "warnings":       {},
+}
+
+
+def _step(name, fn):
+    t0 = time.perf_counter()
+    try:
+        fn()
+        STARTUP["steps"][name] = {"seconds": round(time.perf_counter() - t0, 3)}
+    except Exception as e:
+        STARTUP["steps"][name] = {"seconds": round(time.perf_counter() - t0, 3), "error": str(e)}
+
+
+def _import_libs():
+    import cv2, numpy, qrcode, arabic_reshaper, bidi.algorithm   # noqa: F401
+
+
+def _dummy_cutout() -> Image.Image:
+    img = Image.new("RGBA", (900, 1200), (0, 0, 0, 0))
+    img.paste((214, 170, 140, 255), (300, 200, 600, 600))
+    img.paste((40, 45, 60, 255), (150, 650, 750, 1200))
+    return img
+
+
+def _warm_biometric():
+    cutout = _dummy_cutout()
+    bg     = Image.new("RGBA", cutout.size, (*BG_COLORS["gray"], 255))
+    final  = Image.alpha_composite(bg, cutout).convert("RGB")
+    photo  = enhance_photo(face_aware_crop(final, mm_to_px(35, 300), mm_to_px(45, 300)))
+    sheet  = build_sheet(photo, 4, 2, mm_to_px(3, 300))
+    encode_image(sheet, "jpeg", dpi=300)
+
+
+def _warm_cnss():
+    generate_cnss_card(reg_num="0", nom_ar="اختبار", prenom_ar="اختبار", birth_date="01-01-1970",
+                       cin="X", reg_date="01-01-1970", nom_fr="X", prenom_fr="X",
+                       bg_path=CNSS_BG_PATH)
+
+
+def _warm_family():
+    plan   = get_plan("family", FAMILY_SVG_PATH)
+    _, _, pw, ph, _ = plan.photo_slot
+    person = crop_face(_dummy_cutout(), (pw, ph))
+    plan.encode(plan.render({"husband_name_ar": "اختبار", "husband_cnie": "X"},
+                            photo=person, qr="https://example.com"))
+
+
+def preload_assets():
+    """
+    تحميل الأصول للقراءة فقط: المكتبات، مصنِّفات الوجه، الخطوط، خلفية CNSS
+    وقالب البطاقة العائلية. آمن للاستدعاء قبل fork (لا خيوط).
+    """
+    _step("import_libs", _import_libs)
+    _step("face_cascades", lambda: [detectors.get_cascade(n) for n in FACE_CASCADES])
+    if os.path.exists(CNSS_BG_PATH):
+        _step("cnss_plan", lambda: get_plan("cnss", CNSS_BG_PATH))
+    if os.path.exists(FAMILY_SVG_PATH):
+        _step("family_plan", lambda: get_plan("family", FAMILY_SVG_PATH))
+
+
+def warmup():
+    """
+    preload_assets + تشغيل عرض وهمي في كل مسار (بدون استدعاءات fal).
+    الخدمة جاهزة فقط إذا نجحت كل الخطوات ووُجدت الأصول المطلوبة في WARMUP_REQUIRED.
+    """
+    t0 = time.perf_counter()
+    preload_assets()
+    _step("render_biometric", _warm_biometric)
+    if os.path.exists(CNSS_BG_PATH):
+        _step("render_cnss", _warm_cnss)
+    if os.path.exists(FAMILY_SVG_PATH):
+        _step("render_family", _warm_family)
+    required = {n.strip() for n in os.getenv("WARMUP_REQUIRED", "").split(",")}
+    for name, path in EXPECTED_ASSETS.items():
+        if os.path.exists(path):
+            continue
+        message = f"ملف غير موجود: {os.path.basename(path)}"
+        if name in required:
+            STARTUP["steps"][f"{name}_asset"] = {"seconds": 0.0, "error": message}
+        else:
+            STARTUP["warnings"][name] = message
+    STARTUP["warmup_seconds"] = round(time.perf_counter() - t0, 3)
+    STARTUP["ready"] = not any("error" in step for step in STARTUP["steps"].values())
+
+
+STARTUP["import_seconds"] = round(time.perf_counter() - _T_IMPORT, 3)
@@ -0,0 +1,399 @@
+"""
+metrics.py
+==========
+قياس زمن المراحل بتكلفة شبه معدومة (يبقى مفعّلاً في الإنتاج):
+  • ترويسة Server-Timing لكل طلب بزمن كل مرحلة
+  • عدادات ومدرّجات بصيغة Prometheus على /metrics:
+    زمن المراحل والطلبات، نتائج الاستدعاءات البعيدة (fal)، إصابات الذاكرة المؤقتة،
+    البايتات الداخلة والخارجة، الطلبات الجارية
+
+الاستعمال:
+    with stage("fal_remove_bg"): ...
+    @timed("detect_face")
+    with remote_call("birefnet"): ...
+
+عدة عمليات (gunicorn): METRICS_MULTIPROC_DIR مجلد مشترك — كل عامل يكتب لقطة من
+عداداته فيه دورياً (start_flusher) و /metrics يجمع لقطات كل العمال، فلا ترجع
+العدادات إلى الوراء بين قراءتين مهما كان العامل الذي أجاب. لقطات العمال المنتهين
+تُضم إلى archive.json (archive، من child_exit) وتبقى محسوبة — العدادات لا تنقص —
+إلا المقاييس اللحظية (gauge).
+"""
+
+import os
+import json
+import time
+import atexit
+import bisect
+import tempfile
+import asyncio
+import functools
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_BYTES_BUCKETS   = (1e3, 1e4, 1e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7)
+
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+
+# مراحل الطلب الحالي: قائمة (اسم، مدة بالثواني) — تُنشأ في الوسيط لكل طلب
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+_lock     = threading.Lock()
+_registry = []
+
+
+# ── أنواع المقاييس ────────────────────────────────────────────
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        self.name, self.doc, self.labels = name, doc, labels
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[l] for l in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self, values):
+        for key, value in values.items():
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=_LATENCY_BUCKETS):
+        self.name, self.doc, self.labels = name, doc, labels
+        self.buckets = buckets
+        self.values  = {}   # المفتاح → [عدادات الحاويات..., المجموع، العدد]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[l] for l in self.labels)
+        i   = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self, values):
+        for key, row in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                yield f"{self.name}_bucket", key + (("le", f"{bound:g}"),), cumulative
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), row[-1]
+            yield f"{self.name}_sum",   key, row[-2]
+            yield f"{self.name}_count", key, row[-1]
+
+
+# ── المقاييس المعرّفة ─────────────────────────────────────────
+REQUEST_SECONDS = Histogram("photoadmin_request_seconds", "زمن الطلب الكامل",
+                            ("route", "method", "status"))
+STAGE_SECONDS   = Histogram("photoadmin_stage_seconds", "زمن كل مرحلة معالجة", ("stage",))
+REMOTE_CALLS    = Counter("photoadmin_remote_calls_total", "نتائج الاستدعاءات البعيدة",
+                          ("service", "outcome"))
+REMOTE_SECONDS  = Histogram("photoadmin_remote_seconds", "زمن الاستدعاءات البعيدة", ("service",))
+CACHE_LOOKUPS   = Counter("photoadmin_cache_lookups_total", "عمليات البحث في الذاكرة المؤقتة",
+                          ("cache", "result"))
+BYTES_IN        = Histogram("photoadmin_request_bytes", "حجم جسم الطلب", ("route",),
+                            buckets=_BYTES_BUCKETS)
+BYTES_OUT       = Histogram("photoadmin_response_bytes", "حجم جسم الاستجابة", ("route",),
+                            buckets=_BYTES_BUCKETS)
+IN_FLIGHT       = Gauge("photoadmin_requests_in_flight", "الطلبات الجارية")
+
+
+# ── تسجيل المراحل ────────────────────────────────────────────
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+def timed(name: str):
+    """مزخرف يقيس زمن دالة عادية أو غير متزامنة كمرحلة"""
+    def wrap(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return wrap
+
+
+@contextmanager
+def remote_call(service: str):
+    """يسجل نتيجة وزمن استدعاء بعيد (ok / error)"""
+    t0 = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        REMOTE_SECONDS.observe(time.perf_counter() - t0, service=service)
+        REMOTE_CALLS.inc(service=service, outcome=outcome)
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# ── صيغة Prometheus ───────────────────────────────────────────
+def _fmt_labels(names, key):
+    pairs = list(zip(names, key)) + [p for p in key[len(names):]]
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(value) -> str:
+    """أعداد صحيحة كما هي، والعشرية بدقة كاملة (‎:g يقطع إلى 6 أرقام فتضيع الزيادات)"""
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def render() -> str:
+    collected = _collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.doc}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples(collected[metric.name]):
+            lines.append(f"{name}{_fmt_labels(metric.labels, key)} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ── التجميع بين العمليات ─────────────────────────────────────
+def _snapshot() -> dict:
+    with _lock:
+        return {m.name: {k: list(v) if isinstance(v, list) else v for k, v in m.values.items()}
+                for m in _registry}
+
+
+def reset():
+    """تصفير القيم — في العامل بعد fork حتى لا تُحسب قياسات العملية الرئيسية مرتين"""
+    with _lock:
+        for metric in _registry:
+            metric.values.clear()
+
+
+_ARCHIVE  = "archive.json"   # مجموع لقطات العمال المنتهين (يكتبه المدير فقط)
+_ident    = None             # (pid، معرّف فريد) — معرّف جديد بعد كل fork
+
+
+def _process_id() -> str:
+    """معرّف فريد للعملية (رقم pid قد يُعاد استعماله لعامل جديد)"""
+    global _ident
+    if _ident is None or _ident[0] != os.getpid():
+        _ident = (os.getpid(), os.urandom(8).hex())
+    return _ident[1]
+
+
+def _dump(values: dict) -> dict:
+    return {name: [[list(k), v] for k, v in rows.items()] for name, rows in values.items()}
+
+
+def _write_json(path: str, data: dict):
+    fd, tmp = tempfile.mkstemp(dir=MULTIPROC_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)   # كتابة ذرية
+
+
+def _read_json(path):
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(target: dict, values: dict, gauges: bool):
+    """جمع قيم لقطة ({الاسم: [[المفتاح، القيمة]...]}) في target"""
+    kinds = {m.name: m.kind for m in _registry}
+    for name, rows in values.items():
+        if name not in kinds or (kinds[name] == "gauge" and not gauges):
+            continue
+        merged = target.setdefault(name, {})
+        for key, value in rows:
+            key = tuple(key)
+            if isinstance(value, list):
+                old = merged.get(key)
+                merged[key] = value if old is None else [a + b for a, b in zip(old, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+
+def flush():
+    """كتابة لقطة هذه العملية في MULTIPROC_DIR/<pid>.json"""
+    if not MULTIPROC_DIR:
+        return
+    try:
+        _write_json(os.path.join(MULTIPROC_DIR, f"{os.getpid()}.json"),
+                    {"id": _process_id(), "values": _dump(_snapshot())})
+    except OSError:
+        pass
+
+
+def start_flusher(interval: float = 5.0):
+    """خيط خلفي يكتب لقطة العامل كل interval ثانية (يُستدعى في العامل بعد fork)"""
+    if not MULTIPROC_DIR:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    threading.Thread(target=loop, name="metrics-flush", daemon=True).start()
+    atexit.register(flush)
+
+
+def archive(pid: int):
+    """
+    ضم لقطة عامل منتهٍ إلى archive.json وحذفها — في العملية الرئيسية (child_exit)،
+    فعدد الملفات وكلفة القراءة يبقيان بعدد العمال الأحياء مهما أُعيد تدويرهم.
+    المعرّف يُسجل في merged حتى لا يجمعها قارئ رأى الملفين معاً مرتين.
+    """
+    if not MULTIPROC_DIR:
+        return
+    path     = os.path.join(MULTIPROC_DIR, f"{pid}.json")
+    snapshot = _read_json(path)
+    if snapshot is None:
+        return
+    stored = _read_json(os.path.join(MULTIPROC_DIR, _ARCHIVE)) or {"merged": [], "values": {}}
+    values = {}
+    _merge(values, stored["values"], gauges=False)
+    _merge(values, snapshot["values"], gauges=False)
+    try:
+        _write_json(os.path.join(MULTIPROC_DIR, _ARCHIVE), {
+            "merged": (stored["merged"] + [snapshot["id"]])[-64:],
+            "values": _dump(values),
+        })
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect() -> dict:
+    """قيم هذه العملية، أو مجموع الأرشيف ولقطات العمال في MULTIPROC_DIR"""
+    if not MULTIPROC_DIR:
+        return _snapshot()
+    flush()   # لقطة حديثة للعامل الذي يجيب
+    # اللقطات أولاً ثم الأرشيف: لقطة ضُمّت بين القراءتين تُعرف من معرّفها في merged
+    snapshots = []
+    for path in Path(MULTIPROC_DIR).glob("*.json"):
+        if path.name == _ARCHIVE or not path.stem.isdigit():
+            continue
+        data = _read_json(path)
+        if data is not None:
+            snapshots.append((int(path.stem), data))
+    stored = _read_json(os.path.join(MULTIPROC_DIR, _ARCHIVE)) or {"merged": [], "values": {}}
+
+    merged = {m.name: {} for m in _registry}
+    _merge(merged, stored["values"], gauges=False)
+    archived = set(stored["merged"])
+    for pid, data in snapshots:
+        if data.get("id") not in archived:
+            _merge(merged, data["values"], gauges=_alive(pid))
+    return merged
+
+
+# ── وسيط ASGI ────────────────────────────────────────────────
+class MetricsMiddleware:
+    """
+    وسيط ASGI خفيف (بدون BaseHTTPMiddleware): يعد البايتات والطلبات الجارية
+    ويضيف ترويسة Server-Timing من المراحل المسجلة أثناء الطلب.
+    """
+
+    def __init__(self, app):
+        self.app    = app
+        self._paths = None
+
+    def _route(self, scope):
+        if self._paths is None:
+            self._paths = {getattr(r, "path", None) for r in scope["app"].routes}
+        path = scope["path"]
+        return path if path in self._paths else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route  = self._route(scope)
+        stages = []
+        token  = _request_stages.set(stages)
+        sizes  = {"in": 0, "out": 0, "status": 500}
+        t0     = time.perf_counter()
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["in"] += len(message.get("body", b""))
+            return message
+
+        async def timing_send(message):
+            if message["type"] == "http.response.start":
+                sizes["status"] = message["status"]
+                if stages:
+                    value = ", ".join(f"{name};dur={sec * 1000:.1f}" for name, sec in stages)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", value.encode("latin-1"))
+                    ]
+            elif message["type"] == "http.response.body":
+                sizes["out"] += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc()
+        try:
+            await self.app(scope, counting_receive, timing_send)
+        finally:
+            IN_FLIGHT.dec()
+            _request_stages.reset(token)
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, route=route,
+                                    method=scope["method"], status=str(sizes["status"]))
+            BYTES_IN.observe(sizes["in"], route=route)
+            BYTES_OUT.observe(sizes["out"], route=route)
@@ -0,0 +1,169 @@
+"""
+result_cache.py
+===============
+ذاكرة مؤقتة للمخرجات النهائية (JPEG/ZIP) مفهرسة بمحتوى المدخلات:
+المفتاح = sha256 لتمثيل قانوني لكل المدخلات (حقول النموذج + بصمة الملف المرفوع
++ نسخة القالب/الخلفية). نفس المدخلات → نفس المفتاح → نفس البايتات.
+
+طبقتان محدودتا الحجم:
+  • ذاكرة العملية (LRU)         RESULT_CACHE_MEMORY_MB  (افتراضي 128)
+  • القرص (مشترك بين العمال)   RESULT_CACHE_DISK_MB    (افتراضي 1024، 0 = معطّل)
+                               RESULT_CACHE_DIR        (افتراضي /tmp/photoadmin-results)
+
+المفتاح نفسه يُستعمل كـ ETag قوي؛ If-None-Match المطابق → 304 بدون عرض ولا تحميل.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+import metrics
+
+
+def make_key(kind: str, fields: dict, upload: bytes = None, version: str = "") -> str:
+    """بصمة قانونية لكل مدخلات الطلب"""
+    payload = {
+        "kind":    kind,
+        "version": version,
+        "fields":  fields,
+        "upload":  hashlib.sha256(upload).hexdigest() if upload is not None else None,
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def etag(key: str) -> str:
+    return f'"{key}"'
+
+
+def if_none_match(header: str, tag: str, stored: bool = False) -> bool:
+    """
+    مقارنة If-None-Match (مقارنة ضعيفة كما في RFC 9110، مع دعم القوائم).
+    * تطابق فقط إذا وُجدت نتيجة مخزنة (stored) — وإلا لا شيء لدى العميل ليعيد استعماله.
+    """
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if (candidate == "*" and stored) or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+
+class ResultCache:
+    def __init__(self, memory_bytes: int, disk_bytes: int, disk_dir: str):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes   = disk_bytes
+        self.disk_dir     = Path(disk_dir)
+        self._memory      = OrderedDict()   # المفتاح → البايتات
+        self._memory_size = 0
+        self._disk_size   = None            # يُحسب عند أول كتابة
+        self._lock        = threading.Lock()
+
+    # ── الذاكرة ───────────────────────────────────────────────
+    def _memory_get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            return data
+
+    def _memory_put(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= len(old)
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    # ── القرص ─────────────────────────────────────────────────
+    def _path(self, key):
+        return self.disk_dir / key[:2] / key
+
+    def _disk_get(self, key):
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)   # الأحدث استعمالاً يُحذف آخراً
+        except OSError:
+            pass
+        return data
+
+    def _disk_put(self, key, data):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)   # كتابة ذرية: العمال الآخرون لا يرون ملفاً ناقصاً
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = self._scan_size()
+            else:
+                self._disk_size += len(data)
+            over = self._disk_size > self.disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _scan_size(self):
+        return sum(p.stat().st_size for p in self.disk_dir.glob("*/*") if p.is_file())
+
+    def _evict_disk(self):
+        """حذف الأقدم استعمالاً حتى 90% من الحد (إعادة مسح: عمال آخرون يكتبون أيضاً)"""
+        files = []
+        for p in self.disk_dir.glob("*/*"):
+            try:
+                st = p.stat()
+                files.append((st.st_mtime, st.st_size, p))
+            except OSError:
+                continue
+        total = sum(f[1] for f in files)
+        for _, size, p in sorted(files):
+            if total <= self.disk_bytes * 0.9:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                continue
+        with self._lock:
+            self._disk_size = total
+
+    # ── الواجهة ───────────────────────────────────────────────
+    def get(self, key: str):
+        data = self._memory_get(key)
+        metrics.cache_lookup("result_memory", data is not None)
+        if data is not None or not self.disk_bytes:
+            return data
+        data = self._disk_get(key)
+        metrics.cache_lookup("result_disk", data is not None)
+        if data is not None:
+            self._memory_put(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        self._memory_put(key, data)
+        if self.disk_bytes:
+            self._disk_put(key, data)
+
+
+RESULTS = ResultCache(
+    memory_bytes=int(os.getenv("RESULT_CACHE_MEMORY_MB", "128")) * 1024 * 1024,
+    disk_bytes=int(os.getenv("RESULT_CACHE_DISK_MB", "1024")) * 1024 * 1024,
+    disk_dir=os.getenv("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "photoadmin-results")),
+)
@@ -0,0 +1,146 @@
+"""
+اختبار ذاكرة النتائج لنقطة /api/biometric-photo/batch:
+الطلب الأول يُعرض ويُخزن، الثاني إصابة بنفس البايتات، و If-None-Match → 304.
+استدعاءات fal مستبدلة بدوال محلية — بقية المسار (الكشف، القص، اللوحات، ZIP) حقيقي.
+"""
+
+import io
+import json
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+
+import main
+import result_cache
+
+
+OUTPUTS = json.dumps([
+    {"doc_type": "cin",      "layout": "4x2", "dpi": 300, "bg_color": "gray"},
+    {"doc_type": "passport", "layout": "2x2", "dpi": 150, "bg_color": "gray", "format": "png"},
+])
+
+
+def _photo() -> bytes:
+    img = Image.new("RGB", (600, 800), (120, 140, 165))
+    img.paste((214, 170, 140), (200, 150, 400, 420))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    calls = {"remove_bg": 0, "upscale_ok": True}
+
+    async def fake_remove_bg(image_bytes):
+        calls["remove_bg"] += 1
+        return Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+
+    async def fake_upscale(image_bytes, target_w, target_h):
+        img = Image.open(io.BytesIO(image_bytes)).convert("RGB").resize((target_w, target_h))
+        return img, calls["upscale_ok"]
+
+    monkeypatch.setattr(main, "fal_remove_bg", fake_remove_bg)
+    monkeypatch.setattr(main, "fal_upscale", fake_upscale)
+    monkeypatch.setattr(result_cache, "RESULTS",
+                        result_cache.ResultCache(64 * 1024 * 1024, 64 * 1024 * 1024, str(tmp_path)))
+    c = TestClient(main.app)
+    c.calls = calls
+    return c
+
+
+def _post(client, headers=None):
+    return client.post("/api/biometric-photo/batch",
+                       data={"outputs": OUTPUTS},
+                       files={"file": ("photo.jpg", _photo(), "image/jpeg")},
+                       headers=headers or {})
+
+
+def test_batch_second_request_is_cache_hit(client):
+    first = _post(client)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/zip"
+    etag = first.headers["etag"]
+
+    second = _post(client)
+    assert second.status_code == 200
+    assert second.headers["etag"] == etag
+    assert second.content == first.content
+    assert client.calls["remove_bg"] == 1
+
+    not_modified = _post(client, {"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert client.calls["remove_bg"] == 1
+
+
+def test_batch_upscale_fallback_is_not_cached(client):
+    client.calls["upscale_ok"] = False
+    first = _post(client)
+    assert first.status_code == 200
+    assert "etag" not in first.headers
+
+    second = _post(client)
+    assert second.status_code == 200
+    assert client.calls["remove_bg"] == 2
+
+
+def test_batch_colours_share_one_master(client, monkeypatch):
+    import zipfile
+    outputs = json.dumps([
+        {"doc_type": "cin", "layout": "1x1", "dpi": 300, "bg_color": "gray"},
+        {"doc_type": "cin", "layout": "1x1", "dpi": 300, "bg_color": "white"},
+        {"doc_type": "cin", "layout": "1x1", "dpi": 300, "bg_color": "blue"},
+    ])
+    upscales = []
+
+    async def counting_upscale(image_bytes, target_w, target_h):
+        upscales.append((target_w, target_h))
+        return Image.open(io.BytesIO(image_bytes)).convert("RGB").resize((target_w, target_h)), True
+
+    monkeypatch.setattr(main, "fal_upscale", counting_upscale)
+    resp = client.post("/api/biometric-photo/batch", data={"outputs": outputs},
+                       files={"file": ("photo.jpg", _photo(), "image/jpeg")})
+    assert resp.status_code == 200
+    assert len(upscales) == 1
+    names = zipfile.ZipFile(io.BytesIO(resp.content)).namelist()
+    assert sorted(names) == sorted(f"photo_cin_1x1_300dpi_{c}.jpg" for c in ("gray", "white", "blue"))
+
+
+def test_batch_output_does_not_depend_on_spec_order(client):
+    import zipfile
+
+    def entries(colours):
+        outputs = json.dumps([{"doc_type": "cin", "layout": "1x1", "dpi": 300, "bg_color": c}
+                              for c in colours])
+        resp = client.post("/api/biometric-photo/batch", data={"outputs": outputs},
+                           files={"file": ("photo.jpg", _photo(), "image/jpeg")})
+        assert resp.status_code == 200
+        zf = zipfile.ZipFile(io.BytesIO(resp.content))
+        return {name: zf.read(name) for name in zf.namelist()}
+
+    assert entries(["gray", "white"]) == entries(["white", "gray"])
+
+
+def test_if_none_match_star_needs_a_stored_result(client):
+    fresh = _post(client, {"If-None-Match": "*"})
+    assert fresh.status_code == 200
+    assert fresh.content
+
+    again = _post(client, {"If-None-Match": "*"})
+    assert again.status_code == 304
+    assert client.calls["remove_bg"] == 1
+
+
+def test_batch_archive_is_byte_stable(client, tmp_path, monkeypatch):
+    import time
+
+    first = _post(client)
+    assert first.status_code == 200
+    # مسح الذاكرة (كعامل آخر أو بعد الإخلاء) ثم إعادة العرض بعد تغير الساعة
+    monkeypatch.setattr(result_cache, "RESULTS",
+                        result_cache.ResultCache(0, 0, str(tmp_path / "empty")))
+    time.sleep(2)   # دقة تاريخ ZIP ثانيتان
+    second = _post(client)
+    assert client.calls["remove_bg"] == 2
+    assert second.content == first.content
@@ -0,0 +1,54 @@
+"""
+صيغة Prometheus: القيم الكبيرة تُكتب بدقة كاملة حتى لا تضيع الزيادات الصغيرة.
+"""
+
+import metrics
+
+
+def _line(text, prefix):
+    return next(l for l in text.splitlines() if l.startswith(prefix))
+
+
+def test_large_values_keep_full_precision(monkeypatch):
+    monkeypatch.setattr(metrics.REMOTE_CALLS, "values", {})
+    monkeypatch.setattr(metrics.BYTES_IN, "values", {})
+    metrics.REMOTE_CALLS.inc(1234567, service="birefnet", outcome="ok")
+    metrics.BYTES_IN.observe(5456789.5, route="/api/biometric-photo")
+    metrics.BYTES_IN.observe(1, route="/api/biometric-photo")
+
+    text = metrics.render()
+    assert _line(text, "photoadmin_remote_calls_total{").endswith(" 1234567")
+    assert _line(text, "photoadmin_request_bytes_sum{").endswith(" 5456790.5")
+    assert _line(text, "photoadmin_request_bytes_count{").endswith(" 2")
+
+
+def test_exited_worker_snapshots_are_archived(tmp_path, monkeypatch):
+    import os
+
+    monkeypatch.setattr(metrics, "MULTIPROC_DIR", str(tmp_path))
+    for metric in metrics._registry:
+        monkeypatch.setattr(metric, "values", {})
+
+    def worker(hits):
+        pid = os.fork()
+        if pid == 0:
+            metrics.reset()
+            for _ in range(hits):
+                metrics.cache_lookup("result_memory", True)
+            metrics.IN_FLIGHT.inc()
+            metrics.flush()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        return pid
+
+    total = "photoadmin_cache_lookups_total{"
+    pids  = [worker(2), worker(4)]
+    assert _line(metrics.render(), total).endswith(" 6")
+
+    for pid in pids:
+        metrics.archive(pid)
+    files = sorted(p.name for p in tmp_path.glob("*.json"))
+    assert files == sorted(["archive.json", f"{os.getpid()}.json"])
+    text = metrics.render()
+    assert _line(text, total).endswith(" 6")
+    assert "\nphotoadmin_requests_in_flight " not in text   # gauge العمال المنتهين لا يُجمع
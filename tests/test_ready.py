@@ -0,0 +1,36 @@
+"""
+/api/ready على الشجرة كما هي في المستودع: 200 بعد الإحماء (فحص صحة Railway).
+الأصول غير المنشورة (قالب البطاقة العائلية) تظهر كتحذير فقط.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def startup(monkeypatch):
+    state = {"ready": False, "import_seconds": None, "warmup_seconds": None,
+             "steps": {}, "warnings": {}}
+    monkeypatch.setattr(main, "STARTUP", state)
+    monkeypatch.delenv("WARMUP_REQUIRED", raising=False)
+    return state
+
+
+def test_ready_after_warmup_on_committed_tree(startup):
+    main.warmup()
+    resp = TestClient(main.app).get("/api/ready")
+    assert resp.status_code == 200, resp.json()
+    assert resp.json()["ready"] is True
+    if not main.os.path.exists(main.FAMILY_SVG_PATH):
+        assert "family" in resp.json()["warnings"]
+
+
+def test_required_missing_asset_is_not_ready(startup, monkeypatch):
+    monkeypatch.setenv("WARMUP_REQUIRED", "family")
+    monkeypatch.setitem(main.EXPECTED_ASSETS, "family", "/nonexistent/family_card_template.svg")
+    main.warmup()
+    resp = TestClient(main.app).get("/api/ready")
+    assert resp.status_code == 503
+    assert "error" in resp.json()["steps"]["family_asset"]
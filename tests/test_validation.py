@@ -0,0 +1,41 @@
+"""
+مدخلات غير صالحة → 400 قبل أي استدعاء لـ fal (وليس 500 من KeyError/TypeError).
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def no_fal(*args, **kwargs):
+        raise AssertionError("fal يجب ألا يُستدعى لمدخلات غير صالحة")
+
+    monkeypatch.setattr(main, "fal_remove_bg", no_fal)
+    monkeypatch.setattr(main, "fal_upscale", no_fal)
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("fields", [{"doc_type": "unknown"}, {"bg_color": "pink"}])
+def test_preview_rejects_unknown_choices(client, fields):
+    resp = client.post("/api/biometric-photo/preview", data=fields,
+                       files={"file": ("photo.jpg", b"\xff\xd8\xff\xd9", "image/jpeg")})
+    assert resp.status_code == 400
+
+
+@pytest.mark.parametrize("spec", [
+    {"doc_type": ["cin"]},
+    {"bg_color": {"name": "gray"}},
+    {"layout": 42},
+    {"format": ["png"]},
+    {"dpi": "300"},
+    {"dpi": True},
+])
+def test_batch_rejects_wrongly_typed_specs(client, spec):
+    resp = client.post("/api/biometric-photo/batch", data={"outputs": json.dumps([spec])},
+                       files={"file": ("photo.jpg", b"\xff\xd8\xff\xd9", "image/jpeg")})
+    assert resp.status_code == 400